@@ -1,14 +1,58 @@
 import streamlit as st
-import pandas as pd
-import random
+import contextlib
 import os
-import io
+import random
+import sqlite3
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
 from PIL import Image
-from datetime import datetime, timedelta
+from datetime import datetime
+from io import BytesIO
+
+from ttg import (DAYS_OPTIONS, DEFAULT_SECTIONS, DEFAULT_WEIGHTS, LAB,
+                 RESULT_CACHE, XLSX_MIME, AvailabilityIndex, StageTimer, TimetableStore, TracingHolds, analyze,
+                 build_breaks, class_subjects,
+                 class_workbook, compile_calendar, evaluate, fingerprint,
+                 generate_candidates, load_workbook, make_job,
+                 normalize_class_name, normalize_institution_type,
+                 log_json, phase, plan_from_breaks, profile_run, regenerate,
+                 repair, seed_from_fingerprint, split_class_key,
+                 timetable_filename, write_zip)
 
 # --- Streamlit UI Configuration ---
 st.set_page_config(page_title="Timetable Generator", layout="wide")
 
+# Time, allocations and counts of each stage of this rerun (and of the engine phases inside),
+# shown in the sidebar diagnostics panel at the end
+timer = StageTimer().install()
+
+
+@st.cache_resource
+def tracing_holds():
+    """tracemalloc is process-wide, so every session shares one set of holds on it."""
+    return TracingHolds()
+
+
+# Allocations are only measured while tracemalloc traces, which slows everything down: opt-in per session.
+# The hold is renewed every rerun and lapses an hour after this session's last one (e.g. a closed tab).
+session_holder = st.session_state.setdefault("tracing_holder", uuid.uuid4().hex)
+if st.session_state.get("measure_allocations"):
+    tracing_holds().hold(("measure", session_holder), ttl=3600)
+else:
+    tracing_holds().release(("measure", session_holder))
+
+
+@st.cache_resource
+def phase_log():
+    """JSON line per phase to ``$TTG_PHASE_LOG`` (``-`` for stderr), set up once per server process."""
+    path = os.environ.get("TTG_PHASE_LOG")
+    return log_json(path) if path else None
+
+
+phase_log()
+
 st.markdown("""
     <style>
         /* Glossy light blue background for main container */
@@ -116,15 +160,6 @@ else:
     st.error("Please upload a valid Excel file to proceed.")
     st.stop()
 
-def expand_class_subject_allocation(df):
-    rows = []
-    for _, row in df.iterrows():
-        classes = [c.strip() for c in str(row['Class']).split(',')]
-        for cls in classes:
-            rows.append({'Class': cls, 'Subject': row['Subject']})
-    return pd.DataFrame(rows)
-
-
 # --- Top Header: Logo + Title ---
 col_logo, col_title = st.columns([1, 4])
 with col_logo:
@@ -137,169 +172,23 @@ with col_title:
     st.markdown("## 📜Class Timetable Generator")
 
 # --- Load teacher-subject mapping from Excel ---
-@st.cache_data
-def load_excel_data(file_path, institution_type):
-    xls = pd.ExcelFile(file_path)
-
-    if institution_type == "📚School":
-        df_mapping = pd.read_excel(xls, sheet_name="TeacherMapping")
-        df_subject_hours_raw = pd.read_excel(xls, sheet_name="CLASS-SUBJECT ALLOCATION")
-        df_subject_hours_raw.columns = df_subject_hours_raw.columns.str.strip()  # Clean headers
-        df_subject_hours = expand_class_subject_allocation(df_subject_hours_raw)
-
-        df_classes = pd.read_excel(xls, sheet_name="Classes")
-
-    elif institution_type == "🧪Coaching Institute":
-        df_mapping = pd.read_excel(xls, sheet_name="FACULTY-SUBJECT")
-        df_mapping['Teachers'] = df_mapping['Faculty']
-        df_subject_hours_raw = pd.read_excel(xls, sheet_name="SUBJECTS_COACHING")
-        df_subject_hours_raw.columns = df_subject_hours_raw.columns.str.strip()
-        df_subject_hours_raw.rename(columns={'Stream': 'Class'}, inplace=True)  # Fix here
-        df_subject_hours = expand_class_subject_allocation(df_subject_hours_raw)
-        df_classes = pd.DataFrame({'Class': df_subject_hours['Class'].unique()})
-        df_subjects_coaching = pd.read_excel(excel_path, sheet_name="SUBJECTS_COACHING")
-        df_subjects_coaching.columns = df_subjects_coaching.columns.str.strip()
-        df_subjects_coaching.rename(columns={'Stream': 'Class'}, inplace=True)
-
-        stream_subject_map = df_subjects_coaching.groupby('Class')['Subject'].apply(list).to_dict()
-        # --- Build subject_faculty_map from FACULTY-SUBJECT ---
-        df_faculty = pd.read_excel(excel_path, sheet_name="FACULTY-SUBJECT")
-        df_faculty.columns = df_faculty.columns.str.strip()
-
-        subject_faculty_map = {}
-        for _, row in df_faculty.iterrows():
-            subject = row['Subject']
-            faculty_list = [f.strip() for f in str(row['Faculty']).split(',') if f.strip()]
-            subject_faculty_map[subject] = faculty_list
-
-    elif institution_type == "🏛️College":
-        df_mapping = pd.read_excel(xls, sheet_name="SUBJECTS_COLLEGE")
-        df_mapping['Teachers'] = df_mapping['Faculty']  # unify naming
-        df_subject_hours_raw = pd.read_excel(xls, sheet_name="SUBJECT-ALLOCATION")
-        df_subject_hours_raw.columns = ["Class", "Subject"]
-        df_subject_hours = expand_class_subject_allocation(df_subject_hours_raw)
-        df_classes = pd.DataFrame({'Class': df_subject_hours['Class'].unique()})
-
-    else:
-        raise ValueError("Invalid institution type")
-
-    # Unified mapping logic
-    subject_teacher_map = {}
-    for _, row in df_mapping.iterrows():
-        subject = row['Subject']
-        teachers = [t.strip() for t in str(row['Teachers']).split(',') if t.strip()]
-        subject_teacher_map[subject] = teachers
-
-    return subject_teacher_map, df_subject_hours, df_classes 
-
-    
-# --- Generate actual period times including breaks inline ---
-def generate_period_times(start_time_str, end_time_str, duration, breaks):
-    start_time = datetime.strptime(start_time_str, "%H:%M")
-    end_time = datetime.strptime(end_time_str, "%H:%M")
-    period_times = []
-    current = start_time
-    while current + timedelta(minutes=duration) <= end_time:
-        time_range = f"{current.strftime('%H:%M')} - {(current + timedelta(minutes=duration)).strftime('%H:%M')}"
-        if current.strftime("%H:%M") in breaks:
-            period_times.append(current.strftime("%H:%M"))
-        period_times.append(time_range)
-        current += timedelta(minutes=duration)
-    for b_time in breaks:
-        if b_time not in [p.split(" - ")[0] if " - " in p else p for p in period_times]:
-            period_times.append(b_time)
-    period_times = sorted(period_times, key=lambda x: datetime.strptime(x.split(' - ')[0] if ' - ' in x else x, "%H:%M"))
-    return period_times
-
-# --- Function to generate timetable ---
-def generate_timetable(subject_teacher_map, subject_hours, days, periods, breaks, class_room):
-    timetable = {day: {} for day in days}
-    teacher_timetable = {}
-    subject_alloc = {sub: 0 for sub in subject_hours}
-    pr_subjects = [s for s in subject_hours if subject_hours[s]['PR'] >= 2]
-
-    for day in days:
-        i = 0
-        while i < len(periods):
-            period = periods[i]
-            if period in breaks:
-                for d in timetable:
-                    timetable[d][period] = breaks[period]
-                i += 1
-                continue
-
-            scheduled = False
-            if i + 1 < len(periods) and periods[i + 1] not in breaks:
-                for subject in pr_subjects:
-                    if subject_alloc[subject] + 2 <= subject_hours[subject]['PR']:
-                        teacher = random.choice(subject_teacher_map.get(subject, ["TBD"]))
-                        for d in timetable:
-                            timetable[d].setdefault(periods[i], "")
-                            timetable[d].setdefault(periods[i + 1], "")
-                        timetable[day][periods[i]] = f"{subject} (PR) ({teacher}) [{class_room}]"
-                        timetable[day][periods[i + 1]] = f"{subject} (PR) ({teacher}) [{class_room}]"
-                        subject_alloc[subject] += 2
-
-                        if teacher not in teacher_timetable:
-                            teacher_timetable[teacher] = {d: {} for d in days}
-                        teacher_timetable[teacher][day][periods[i]] = f"{subject} (PR) [{class_room}]"
-                        teacher_timetable[teacher][day][periods[i + 1]] = f"{subject} (PR) [{class_room}]"
-                        scheduled = True
-                        i += 2
-                        break
-
-            if scheduled:
-                continue
-
-            valid_subjects = [s for s in subject_hours if subject_alloc[s] < subject_hours[s]['TH'] + subject_hours[s]['PR']]
-            if not valid_subjects:
-                break
-
-            subject = max(valid_subjects, key=lambda s: (subject_hours[s]['TH'] + subject_hours[s]['PR']) - subject_alloc[s])
-            teacher = random.choice(subject_teacher_map.get(subject, ["TBD"]))
-            subject_alloc[subject] += 1
-
-            for d in timetable:
-                timetable[d].setdefault(period, "")
-            entry_text = f"{subject} TH ({teacher}) [{class_room}]"
-            if subject_hours[subject]['PR'] > 0:
-                entry_text = f"{subject} TH (PR) ({teacher}) [{class_room}]"
-            timetable[day][period] = entry_text
-
-            if teacher not in teacher_timetable:
-                teacher_timetable[teacher] = {d: {} for d in days}
-            teacher_timetable[teacher][day][period] = entry_text.replace(f"[{class_room}]", "").strip()
-            i += 1
-
-    timetable_df = pd.DataFrame(timetable).T
-    timetable_df = timetable_df.fillna("")
-    return timetable_df, teacher_timetable
-
-# --- Load teacher-subject mapping ---
-# Load from Excel
+# The engine parses each sheet once per workbook and caches the result by content hash,
+# so reruns with the same upload skip openpyxl entirely.
 try:
-    subject_teacher_map, df_subject_hours, df_classes = load_excel_data(excel_path, institution_type)
-    
-
+    with timer.stage("Workbook"):
+        workbook = load_workbook(excel_path, institution_type)
 except Exception as e:
     st.error(f"Error loading Excel file: {e}")
     st.stop()
-# Define stream_subject_map and subject_faculty_map from Excel if Coaching Institute is selected
-stream_subject_map = {}
-subject_faculty_map = {}
+subject_teacher_map, df_subject_hours, df_classes = workbook.subject_teacher_map, workbook.df_subject_hours, workbook.df_classes
+# stream_subject_map and subject_faculty_map are only filled for a Coaching Institute workbook
+stream_subject_map = workbook.stream_subject_map
+subject_faculty_map = workbook.subject_faculty_map
+
+# Coaching only: sessions pinned at a fixed time and flexible sessions, for the selected batch
+fixed_sessions = []
+flexible_sessions = []
 
-if institution_type == "🧪Coaching Institute":
-    df_subjects_coaching = pd.read_excel(excel_path, sheet_name="SUBJECTS_COACHING")
-    df_subjects_coaching.columns = df_subjects_coaching.columns.str.strip()
-    df_subjects_coaching.rename(columns={'Stream': 'Class'}, inplace=True)
-    stream_subject_map = df_subjects_coaching.groupby('Class')['Subject'].apply(list).to_dict()
-
-    df_faculty = pd.read_excel(excel_path, sheet_name="FACULTY-SUBJECT")
-    df_faculty.columns = df_faculty.columns.str.strip()
-    subject_faculty_map = {
-        row['Subject']: [f.strip() for f in str(row['Faculty']).split(',')]
-        for _, row in df_faculty.iterrows()
-    }
 if institution_type == "🧪Coaching Institute":
     st.markdown("### 🏷️ Coaching Batch Setup")
     selected_class = st.selectbox("Select Stream (e.g., IIT-JEE-11):", df_classes['Class'].unique())
@@ -310,24 +199,30 @@ if institution_type == "🧪Coaching Institute":
     custom_schedules = []
     subjects_for_stream = stream_subject_map.get(selected_class, [])
 
-    for subject in subjects_for_stream:
-        col1, col2, col3, col4 = st.columns([2, 2, 1, 2])
-        with col1:
-            day = st.selectbox(f"{subject} - Day", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"], key=f"{subject}_day")
-        with col2:
-            start_time = st.time_input(f"{subject} - Start Time", value=datetime.strptime("09:00", "%H:%M").time(), key=f"{subject}_start")
-        with col3:
-            duration = st.number_input(f"{subject} - Min", min_value=30, max_value=180, value=60, step=15, key=f"{subject}_duration")
-        with col4:
-            faculty = st.selectbox(f"{subject} - Faculty", subject_faculty_map.get(subject, ["TBD"]), key=f"{subject}_faculty")
-
-        custom_schedules.append({
-            "subject": subject,
-            "day": day,
-            "start_time": start_time,
-            "duration": duration,
-            "faculty": faculty
-        })
+    # A form: editing a row does not rerun the app until the schedule is applied
+    with st.form("coaching_schedule", border=False):
+        for subject in subjects_for_stream:
+            col1, col2, col3, col4, col5 = st.columns([2, 2, 1, 2, 1])
+            with col1:
+                day = st.selectbox(f"{subject} - Day", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"], key=f"{subject}_day")
+            with col2:
+                start_time = st.time_input(f"{subject} - Start Time", value=datetime.strptime("09:00", "%H:%M").time(), key=f"{subject}_start")
+            with col3:
+                duration = st.number_input(f"{subject} - Min", min_value=30, max_value=180, value=60, step=15, key=f"{subject}_duration")
+            with col4:
+                faculty = st.selectbox(f"{subject} - Faculty", subject_faculty_map.get(subject, ["TBD"]), key=f"{subject}_faculty")
+            with col5:
+                pinned = st.checkbox("📌Pin", key=f"{subject}_pinned", help="Keep this session at exactly this day and time")
+
+            custom_schedules.append({
+                "subject": subject,
+                "day": day,
+                "start_time": start_time,
+                "duration": duration,
+                "faculty": faculty,
+                "pinned": pinned
+            })
+        st.form_submit_button("✅Apply schedule")
     # ---------- DEFINE FLEXIBLE SESSIONS ----------
     st.markdown("### 🌀 Define Flexible Sessions")
 
@@ -350,6 +245,13 @@ if institution_type == "🧪Coaching Institute":
             "day": preferred_day
         })
 
+    # Pinned sessions and named flexible sessions are placed before the rest is filled in
+    fixed_sessions = [
+        {**session, "start_time": session["start_time"].strftime("%H:%M")}
+        for session in custom_schedules if session["pinned"]
+    ]
+    flexible_sessions = [session for session in flexible_sessions if session["name"].strip()]
+
 elif institution_type == "🏛️College":
     st.markdown("### 🏫 College Class Setup")
     selected_class = st.selectbox("Select Year (e.g., Sem 1-ETC):", df_classes['Class'].unique())
@@ -359,7 +261,7 @@ elif institution_type == "🏛️College":
 else:
     # School
     selected_class = st.selectbox("Select Class:", df_classes['Class'].unique().tolist())
-    selected_class = str(selected_class).replace("Std.", "").strip()
+    selected_class = normalize_class_name(selected_class)
     selected_section = st.selectbox("Select Section:", ["A", "B", "C"])
     class_room = st.text_input("Enter Classroom (e.g., Room 101)", "Room 101", key="room_input")
 
@@ -378,10 +280,7 @@ else:
 #class_room = st.text_input("Enter Classroom (e.g., Room 101)", "Room 101", key="room_input")
 
 # --- Configuration (unchanged) ---
-days_options = {
-    "Mon–Fri": ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
-    "Mon–Sat": ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-}
+days_options = DAYS_OPTIONS
 st.markdown("### 🔔Configure Breaks")
 
 break1_time = st.time_input("Short Break Time", value=datetime.strptime("10:00", "%H:%M").time(), key="short_break_time")
@@ -390,10 +289,7 @@ break1_duration = st.number_input("Short Break Duration (minutes)", min_value=5,
 break2_time = st.time_input("Lunch Break Time", value=datetime.strptime("12:00", "%H:%M").time(), key="lunch_break_time")
 break2_duration = st.number_input("Lunch Break Duration (minutes)", min_value=10, max_value=60, value=30, key="lunch_break_duration")
 
-breaks = {
-    break1_time.strftime("%H:%M"): f"Short Break ({break1_duration} min)",
-    break2_time.strftime("%H:%M"): f"Lunch Break ({break2_duration} min)"
-}
+breaks = build_breaks(break1_time.strftime("%H:%M"), break1_duration, break2_time.strftime("%H:%M"), break2_duration)
 
 selected_days_key = st.radio("📢Select Working Days:", list(days_options.keys()))
 days = days_options[selected_days_key]
@@ -402,56 +298,61 @@ start_time = st.time_input("Select Start Time", value=datetime.strptime("07:45",
 end_time = st.time_input("Select End Time", value=datetime.strptime("14:30", "%H:%M").time())
 period_duration = st.number_input("Enter Period Duration (in minutes)", min_value=30, max_value=120, value=60, step=5)
 
-periods = generate_period_times(start_time.strftime("%H:%M"), end_time.strftime("%H:%M"), period_duration, breaks)
-number_of_periods = len([p for p in periods if p not in breaks])
-#st.info(f"Total periods per day (excluding breaks): {number_of_periods}")
-
-# Weekly available hours
-total_periods = number_of_periods * len(days)
-total_minutes = total_periods * period_duration
-available_hours = total_minutes // 60
-st.metric(label="🗣️Available Teaching Hours", value=f"{available_hours} hrs", delta=None)
+# Compiled once per configuration: periods in minutes with real break lengths, per-day end times
+day_plan = plan_from_breaks(start_time.strftime("%H:%M"), end_time.strftime("%H:%M"), period_duration, breaks)
+day_plans = {}
+if "Saturday" in days:
+    saturday_end = st.time_input("Saturday End Time", value=end_time, key="saturday_end")
+    if saturday_end != end_time:
+        day_plans["Saturday"] = plan_from_breaks(start_time.strftime("%H:%M"), saturday_end.strftime("%H:%M"),
+                                                 period_duration, breaks)
+with timer.stage("Calendar"):
+    calendar = compile_calendar(days, day_plan, day_plans)
+periods, breaks = calendar.periods, calendar.breaks
+
+# Weekly capacity, in periods: the subject "Hrs" inputs below are periods per week
+total_periods = calendar.teaching_slots()
+st.metric(label="🗣️Available Teaching Periods", value=f"{total_periods} periods", delta=None)
 
 subjects = list(subject_teacher_map.keys())
 
 # --- Step 2: Filter subjects by selected class ---
-df_subject_hours['Class'] = df_subject_hours['Class'].astype(str).str.strip()
-df_filtered_subjects = df_subject_hours[df_subject_hours['Class'] == selected_class]
-subjects = df_filtered_subjects['Subject'].unique().tolist()
+subjects = class_subjects(df_subject_hours, selected_class)
 
 st.markdown("### 📖Define Weekly Hours per Subject")
 subject_hours = {}
 total_requested_hours = 0
 
-# --- Step 3: Loop through each subject for TH/PR hours input ---
-for subject in subjects:
-    col1, col2 = st.columns(2)
-    with col1:
-        th = st.number_input(f"{subject} - Theory Hrs", min_value=0, max_value=45, value=3, key=f"{subject}_th")
-    with col2:
-        pr = st.number_input(f"{subject} - Practical Hrs", min_value=0, max_value=20, value=0, key=f"{subject}_pr")
-    subject_hours[subject] = {"TH": th, "PR": pr}
-    total_requested_hours += th + pr
-
-# --- Step 4: Add two custom "TBD" subjects ---
-st.markdown("### ⭐Add Optional Custom Subjects")
-
-for i in range(1, 3):  # Two custom subjects
-    col1, col2, col3 = st.columns([1, 1, 2])
-    with col1:
-        custom_subject = st.text_input(f"Custom Subject {i}", key=f"custom_sub_{i}")
-    with col2:
-        th = st.number_input(f"TH Hrs {i}", min_value=0, max_value=45, value=0, key=f"custom_th_{i}")
-    with col3:
-        pr = st.number_input(f"PR Hrs {i}", min_value=0, max_value=20, value=0, key=f"custom_pr_{i}")
-
-    if custom_subject:
-        subject_hours[custom_subject] = {"TH": th, "PR": pr}
+# The hours are one form: typing in a TH/PR box does not rerun the app, "Apply hours" does once
+with st.form("subject_hours", border=False):
+    # --- Step 3: Loop through each subject for TH/PR hours input ---
+    for subject in subjects:
+        col1, col2 = st.columns(2)
+        with col1:
+            th = st.number_input(f"{subject} - Theory Hrs", min_value=0, max_value=45, value=3, key=f"{subject}_th")
+        with col2:
+            pr = st.number_input(f"{subject} - Practical Hrs", min_value=0, max_value=20, value=0, key=f"{subject}_pr")
+        subject_hours[subject] = {"TH": th, "PR": pr}
         total_requested_hours += th + pr
 
-st.success(f"🗣️Total subject hours requested: {total_requested_hours} hrs")
-if total_requested_hours > available_hours:
-    st.error("❌Total subject hours exceed available weekly hours! Please adjust.")
+    # --- Step 4: Add two custom "TBD" subjects ---
+    st.markdown("### ⭐Add Optional Custom Subjects")
+
+    for i in range(1, 3):  # Two custom subjects
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            custom_subject = st.text_input(f"Custom Subject {i}", key=f"custom_sub_{i}")
+        with col2:
+            th = st.number_input(f"TH Hrs {i}", min_value=0, max_value=45, value=0, key=f"custom_th_{i}")
+        with col3:
+            pr = st.number_input(f"PR Hrs {i}", min_value=0, max_value=20, value=0, key=f"custom_pr_{i}")
+
+        if custom_subject:
+            subject_hours[custom_subject] = {"TH": th, "PR": pr}
+            total_requested_hours += th + pr
+    st.form_submit_button("✅Apply hours", type="primary")
+
+st.success(f"🗣️Total periods requested: {total_requested_hours}")
 
 # Existing timetable versions in session state
 if "generated_timetables" not in st.session_state:
@@ -460,67 +361,383 @@ if "generated_timetables" not in st.session_state:
 if "generate_clicked" not in st.session_state:
     st.session_state.generate_clicked = False
 
+# Counts Generate clicks so each click gives new candidates, while the same click on the
+# same inputs (from any session) maps to the same cached result
+if "generate_count" not in st.session_state:
+    st.session_state.generate_count = 0
+
+
+def version_timetable(data):
+    """Timetable of one version, from the shared result cache or rebuilt from its seed.
+
+    Session state only keeps the seed and the inputs each version was solved
+    and repaired with; repairs are replayed with the same seeded rng.
+    """
+    def rebuild():
+        jobs = data["jobs"]
+        timetable = regenerate(jobs[0], data["seed"])
+        for previous, job in zip(jobs, jobs[1:]):
+            repair(timetable, job["subject_teacher_map"], job["class_subject_hours"], job["class_rooms"],
+                   previous=(previous["subject_teacher_map"], previous["class_subject_hours"]),
+                   rng=random.Random(data["seed"]), rooms=job.get("rooms"), class_sizes=job.get("class_sizes"))
+        return timetable
+    return RESULT_CACHE.get_or_compute(data["key"], rebuild)
+
+
+# Uncompressed and shared by every session, so idle entries expire; they rebuild from the byte-bounded RESULT_CACHE
+@st.cache_resource(max_entries=32, ttl=600)
+def shown_timetable(key, _data):
+    """Timetable of a version for display, built once per key and shared by reruns; never mutate it."""
+    return version_timetable(_data)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_precheck(key, _subject_teacher_map, _class_subject_hours, _days, _periods, _breaks, _class_rooms,
+                    _rooms, _calendar):
+    """Capacity pre-check, recomputed only when ``key`` (a fingerprint of the arguments) changes."""
+    return analyze(_subject_teacher_map, _class_subject_hours, _days, _periods, _breaks, _class_rooms,
+                   rooms=_rooms, calendar=_calendar)
+
+
+@st.cache_resource
+def timetable_store():
+    """One SQLite store per server process; ``None`` when the database cannot be opened."""
+    try:
+        return TimetableStore()
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def save_version(data, version):
+    """Keep a version in the local store so it survives a browser refresh; returns its id, or ``None``.
+
+    The store belongs to the server process, so a saved version is listed for every session.
+    """
+    store = timetable_store()
+    if store is None:
+        st.caption("The timetable store is not available on this server")
+        return None
+    try:
+        return store.save(version_timetable(data), data["key"], seed=data["seed"],
+                          label=f"{data['class_key']} · V{version}", metrics=data["metrics"],
+                          extra={"class_key": data["class_key"], "seed": data["seed"], "jobs": data["jobs"]})
+    except sqlite3.Error as e:
+        st.caption(f"Could not save version {version}: {e}")
+        return None
+
+
+@contextlib.contextmanager
+def profiling():
+    """cProfile and tracemalloc the block when "Profile the next Generate" is ticked in the diagnostics panel."""
+    if not st.session_state.get("profile_generate"):
+        yield None
+        return
+    # Held for the block so another session unticking "Measure allocations" cannot stop tracing mid-profile
+    with tracing_holds().holding(("profile", session_holder)), \
+            profile_run(tempfile.mkdtemp(prefix="ttg-profile-"), name=f"generate-{timer.run_id}") as paths:
+        yield paths
+
+
+num_versions = st.selectbox("Number of Different Timetables to Generate:", [1, 2, 3, 5, 10])
+num_candidates = st.number_input("Candidates to evaluate (best ones are kept)", min_value=1, max_value=500, value=num_versions, key="num_candidates")
+seed_text = st.text_input("Regenerate from seed (optional)", "", key="regen_seed")
+optimize_moves = st.number_input("Optimization moves per candidate (0 = greedy only)", min_value=0, max_value=5_000_000, value=20_000, step=10_000, key="optimize_moves")
+with st.expander("⚙️Optimization objective"):
+    objective_weights = {
+        "subject_repeats": st.number_input("Spread subjects across days (weight)", min_value=0.0, value=DEFAULT_WEIGHTS["subject_repeats"], key="w_subject_repeats"),
+        "teacher_gaps": st.number_input("Minimize teacher idle gaps (weight)", min_value=0.0, value=DEFAULT_WEIGHTS["teacher_gaps"], key="w_teacher_gaps"),
+        "load_imbalance": st.number_input("Balance daily load (weight)", min_value=0.0, value=DEFAULT_WEIGHTS["load_imbalance"], key="w_load_imbalance"),
+    }
 
-num_versions = st.selectbox("Number of Different Timetables to Generate:", [1, 2, 3])
-
+# --- Whole-institution mode: every class/section solved together ---
+whole_institution = st.checkbox("🏫Solve all classes together (no teacher/room double-booking)", key="whole_institution")
+selected_key = f"{selected_class} {selected_section}"
+class_subject_hours = {selected_key: subject_hours}
+class_rooms = {selected_key: class_room}
+if whole_institution:
+    room_pattern = st.text_input("Classroom for other classes (use {class} and {section})", "{class}-{section}", key="room_pattern")
+    for cls in df_classes['Class'].unique():
+        cls = normalize_class_name(cls)
+        cls_hours = {
+            s: {"TH": st.session_state.get(f"{s}_th", 3), "PR": st.session_state.get(f"{s}_pr", 0)}
+            for s in class_subjects(df_subject_hours, cls)
+        }
+        for section in DEFAULT_SECTIONS[normalize_institution_type(institution_type)]:
+            class_subject_hours[f"{cls} {section}"] = cls_hours
+            class_rooms[f"{cls} {section}"] = room_pattern.format(**{"class": cls, "section": section})
+    # The class being edited keeps its custom subjects and classroom
+    class_subject_hours[selected_key] = subject_hours
+    class_rooms[selected_key] = class_room
+
+# --- Rooms and labs from the optional Rooms sheet, allocated per slot ---
+class_sizes = None
+if workbook.rooms:
+    n_labs = sum(room.kind == LAB for room in workbook.rooms)
+    st.caption(f"🚪{len(workbook.rooms)} rooms loaded ({n_labs} labs): practicals get a free lab, "
+               f"theory moves to a free room when the classroom is taken")
+    class_strength = st.number_input("Students per class (0 = ignore room capacity)", min_value=0, max_value=1000,
+                                     value=0, key="class_strength")
+    if class_strength:
+        class_sizes = {class_key: class_strength for class_key in class_subject_hours}
+
+# Solver inputs beyond the hours, shared by Generate and the repair button
+solve_inputs = {
+    "fixed_sessions": {selected_key: fixed_sessions} if fixed_sessions else None,
+    "flexible_sessions": {selected_key: flexible_sessions} if flexible_sessions else None,
+    "rooms": workbook.rooms,
+    "class_sizes": class_sizes,
+    "calendar": calendar,
+}
 
+# --- Pre-check: class, practical-slot, teacher, room and lab capacity before spending solver time ---
+with timer.stage("Pre-check"):
+    precheck = cached_precheck(
+        fingerprint(workbook.digest, subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms,
+                    calendar),
+        subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms, workbook.rooms, calendar,
+    )
+generate_anyway = True
+if precheck["ok"]:
+    st.caption(f"✅Capacity pre-check passed in {precheck['elapsed'] * 1000:.1f} ms")
+else:
+    for issue in precheck["issues"]:
+        st.error(f"❌{issue.message}")
+    generate_anyway = st.checkbox("Generate anyway (periods that cannot fit are listed as unplaced)",
+                                  key="generate_anyway")
 
 # Trigger generation
-if st.button("📝Generate Timetable"):
+if st.button("📝Generate Timetable", disabled=not generate_anyway):
     st.session_state.generated_timetables.clear()
     st.session_state.generate_clicked = True
-    for version in range(1, num_versions + 1):
-        timetable_df, teacher_timetable = generate_timetable(
-            subject_teacher_map, subject_hours, days, periods, breaks, class_room
-        )
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            timetable_df.to_excel(writer, index=True, sheet_name='Class Timetable')
-            for teacher, schedule in teacher_timetable.items():
-                teacher_df = pd.DataFrame(schedule).T
-                teacher_df.to_excel(writer, sheet_name=f"{teacher[:30]}")
-        output.seek(0)
-
+    st.session_state.generate_count += 1
+    job = make_job(subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms,
+                   weights=objective_weights, optimize_moves=optimize_moves, **solve_inputs)
+    n_candidates = max(num_candidates, num_versions)
+    inputs_key = fingerprint(workbook.digest, job, n_candidates, num_versions)
+    if seed_text.strip().isdigit():
+        request_key = fingerprint(inputs_key, int(seed_text))
+    else:
+        request_key = fingerprint(inputs_key, "click", st.session_state.generate_count)
+
+    with timer.stage("Generate"), profiling() as profile_paths:
+        # Ranked (seed, metrics) per request; each version's timetable is cached under its own key
+        ranked = RESULT_CACHE.get(request_key)
+        if ranked is None:
+            if seed_text.strip().isdigit():
+                seed = int(seed_text)
+                timetable = regenerate(job, seed)
+                best = [{"seed": seed, "metrics": evaluate(timetable, objective_weights), "timetable": timetable}]
+            else:
+                # In-process: a pool forked per click, per session, would oversubscribe the shared server
+                with st.spinner(f"Evaluating {n_candidates} candidates..."):
+                    best = generate_candidates(job, n_candidates, top_k=num_versions,
+                                               base_seed=seed_from_fingerprint(inputs_key, st.session_state.generate_count),
+                                               workers=1)
+            ranked = [(candidate["seed"], candidate["metrics"]) for candidate in best]
+            RESULT_CACHE.put(request_key, ranked)
+            for candidate in best:
+                RESULT_CACHE.put(fingerprint(workbook.digest, candidate["seed"], [job]), candidate["timetable"])
+
+    if profile_paths:
+        st.session_state.profile_paths = profile_paths
+        st.session_state.profile_generate = False
+    for version, (seed, metrics) in enumerate(ranked, start=1):
         st.session_state.generated_timetables[version] = {
-            "df": timetable_df,
-            "teacher": teacher_timetable,
-            "excel": output.getvalue()
+            "key": fingerprint(workbook.digest, seed, [job]),
+            "class_key": selected_key,
+            "seed": seed,
+            "metrics": metrics,
+            "jobs": [job]
         }
 
-# Display and download if generated
-if st.session_state.generate_clicked and st.session_state.generated_timetables:
-    for version, data in st.session_state.generated_timetables.items():
-        st.markdown(f"## Version {version}: Timetable for {selected_class} {selected_section}")
-
-        tt_title = f"{selected_class} {selected_section}"
-        if institution_type == "🧪Coaching Institute":
-            tt_title = f"Stream {selected_class} - Group {selected_section}"
-        elif institution_type == "🏛️College":
-            tt_title = f"{selected_class} - Division {selected_section}"
-
-        #st.markdown(f"## Version {version}: Timetable for {tt_title}")
-
-
-        def color_breaks(val):
-            if isinstance(val, str) and 'Break' in val:
-                return 'background-color: lightpink'
-            return ''
-
-        styled_df = data["df"].style.applymap(color_breaks)
+# Re-place only what the edited hours/teachers affect, keeping the reviewed layout
+if st.session_state.generated_timetables and st.button("🩹Apply changed hours to current timetable"):
+    with timer.stage("Repair"):
+        for version, data in st.session_state.generated_timetables.items():
+            previous = data["jobs"][-1]
+            timetable = version_timetable(data)
+            try:
+                stats = repair(timetable, subject_teacher_map, class_subject_hours, class_rooms,
+                               previous=(previous["subject_teacher_map"], previous["class_subject_hours"]),
+                               rng=random.Random(data["seed"]), rooms=solve_inputs["rooms"],
+                               class_sizes=solve_inputs["class_sizes"])
+            except ValueError as e:
+                st.warning(f"Version {version}: {e}")
+                continue
+            data["jobs"].append(make_job(subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms,
+                                         weights=objective_weights, optimize_moves=optimize_moves, **solve_inputs))
+            data["key"] = fingerprint(workbook.digest, data["seed"], data["jobs"])
+            data["metrics"] = evaluate(timetable, objective_weights)
+            RESULT_CACHE.put(data["key"], timetable)
+            st.success(f"Version {version}: {stats['removed']} periods removed, {stats['added']} added, "
+                       f"{stats['reassigned']} reassigned in {stats['elapsed'] * 1000:.0f} ms")
+
+# --- Saved timetables: reload a past version, or query it, without solving again ---
+with timer.stage("Saved timetables"):
+    store = timetable_store()
+    saved_versions = store.versions() if store is not None else []
+    if saved_versions:
+        with st.expander(f"🗄️Saved timetables ({len(saved_versions)} most recent)"):
+            saved = st.selectbox(
+                "Saved version", saved_versions, key="saved_version",
+                format_func=lambda v: f"#{v['id']} {v['label']} · {datetime.fromtimestamp(v['created']):%d %b %H:%M}"
+                                      + (f" · score {v['metrics']['score']:g}" if v["metrics"] else ""),
+            )
+            if st.button("📂Load saved version"):
+                timetable, extra = store.load(saved["id"])
+                RESULT_CACHE.put(saved["fingerprint"], timetable)
+                st.session_state.generated_timetables = {1: {
+                    "key": saved["fingerprint"],
+                    "class_key": extra["class_key"],
+                    "seed": extra["seed"],
+                    "metrics": saved["metrics"] or evaluate(timetable, objective_weights),
+                    "jobs": extra["jobs"]
+                }}
+                st.session_state.generate_clicked = True
+            teacher_load = store.teacher_load(saved["id"])
+            st.dataframe(pd.DataFrame(list(teacher_load.items()), columns=["Teacher", "Periods per week"]),
+                         use_container_width=True)
+
+
+BREAK_STYLE = "background-color: lightpink"
+# Faculty timetables open at once; the rest are picked from the load summary on demand
+TEACHERS_PER_PAGE = 8
+
+
+def style_breaks(frame, mask):
+    """Colour the break cells from a days x periods mask in one vectorized call (no per-cell callback)."""
+    return frame.style.apply(lambda _: np.where(mask, BREAK_STYLE, ""), axis=None)
+
+
+# A fragment per version: its buttons and the substitute finder rerun only this version's block
+@st.fragment
+def show_version(version, data):
+    started = StageTimer()
+    st.markdown(f"## Version {version}: Timetable for {data['class_key']}")
+
+    tt_title = f"{selected_class} {selected_section}"
+    if institution_type == "🧪Coaching Institute":
+        tt_title = f"Stream {selected_class} - Group {selected_section}"
+    elif institution_type == "🏛️College":
+        tt_title = f"{selected_class} - Division {selected_section}"
+
+    #st.markdown(f"## Version {version}: Timetable for {tt_title}")
+
+    timetable = shown_timetable(data["key"], data)
+    repaired = f" (repaired {len(data['jobs']) - 1}x)" if len(data["jobs"]) > 1 else ""
+    st.caption(f"Seed {data['seed']}{repaired} · score {data['metrics']['score']:g} · "
+               + ", ".join(f"{k.replace('_', ' ')} {v}" for k, v in data["metrics"].items() if k != "score"))
+    if timetable.unplaced:
+        st.warning(f"⚠️{len(timetable.unplaced)} class(es) have periods that could not be placed.")
+        with st.expander("Unplaced periods"):
+            for class_key, missing in timetable.unplaced.items():
+                st.write(f"{class_key}: " + ", ".join(f"{sub} x{n}" for sub, n in missing.items()))
+
+    styled_df = style_breaks(timetable.class_frame(data["class_key"]), timetable.break_cells(data["class_key"]))
+    with phase("render class table"):
         st.dataframe(styled_df, use_container_width=True)
 
+    class_sessions = [session for session in timetable.sessions if session["class"] == data["class_key"]]
+    if class_sessions:
+        with st.expander(f"📌Pinned and flexible sessions ({len(class_sessions)})"):
+            st.dataframe(pd.DataFrame(class_sessions).drop(columns="class"), use_container_width=True)
+    for conflict in timetable.conflicts:
+        st.warning(f"⚠️Not pinned: {conflict}")
+
+    # Only saved when asked: the store is shared by every session on this server
+    if st.button(f"💾Save version {version}", key=f"save_version_{version}",
+                 help="Saved versions are listed under Saved timetables for everyone using this server"):
+        version_id = save_version(data, version)
+        if version_id is not None:
+            st.caption(f"Saved as #{version_id}")
+
+    # The workbook is only built when asked for and is not kept in session state
+    if st.button(f"Prepare Excel - Version {version}", key=f"prepare_excel_{version}"):
         st.download_button(
             label=f"Download Class Timetable - Version {version}",
-            data=data["excel"],
-            file_name=f"{selected_class}_{selected_section}_Timetable_V{version}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key=f"download_excel_{version}"
+            data=class_workbook(timetable, data["class_key"]),
+            file_name=timetable_filename(*split_class_key(data["class_key"]), version),
+            mime=XLSX_MIME,
+            key=f"download_excel_{version}",
+            on_click="ignore"
+        )
+
+    if len(timetable.classes) > 1 and st.button(f"📦Prepare whole-institution ZIP - Version {version}",
+                                                key=f"prepare_zip_{version}"):
+        archive = BytesIO()
+        with st.spinner("Building class, faculty and master workbooks..."):
+            n_files = write_zip(timetable, archive, workers=1)
+        st.download_button(
+            label=f"Download ZIP ({n_files} workbooks) - Version {version}",
+            data=archive.getvalue(),
+            file_name=f"Timetables_V{version}.zip",
+            mime="application/zip",
+            key=f"download_zip_{version}",
+            on_click="ignore"
         )
 
-        st.markdown("### 🧑‍🏫Faculty-wise Timetable")
-        for teacher, schedule in data["teacher"].items():
-            with st.expander(f"{teacher}"):
-                teacher_df = pd.DataFrame(schedule).T
-                styled_teacher_df = teacher_df.style.applymap(color_breaks)
-                st.dataframe(styled_teacher_df, use_container_width=True)
+    # One virtualized load table for every teacher; a timetable is only built for the teachers picked,
+    # so the page costs the same for a whole school as for one class
+    st.markdown("### 🧑‍🏫Faculty-wise Timetable")
+    scope = timetable.class_teachers(data["class_key"])
+    if len(timetable.classes) > 1 and st.toggle("All teachers of the institution", key=f"all_teachers_{version}"):
+        scope = None
+    loads = timetable.teacher_loads(scope)
+    st.dataframe(pd.DataFrame(list(loads.items()), columns=["Teacher", "Periods per week"]), hide_index=True,
+                 use_container_width=True, height=min(35 * len(loads) + 38, 300))
+    picked = st.multiselect(f"Open faculty timetables (up to {TEACHERS_PER_PAGE} at a time)", list(loads),
+                            max_selections=TEACHERS_PER_PAGE, key=f"open_teachers_{version}")
+    with phase("render teacher tables") as call:
+        for teacher in picked:
+            # Teacher views only show the periods taught, so they have no break cells to colour
+            st.markdown(f"#### {teacher}")
+            st.dataframe(timetable.teacher_frame(teacher), use_container_width=True)
+        call.count(tables=len(picked))
+
+    # --- Cover for absences: bitset lookups instead of reading every faculty table ---
+    with st.expander("🩺Find substitutes for absent teachers"):
+        availability = AvailabilityIndex(timetable, subject_teacher_map)
+        cover_day = st.selectbox("Day", timetable.days, key=f"cover_day_{version}")
+        absent = st.multiselect("Absent teachers", availability.teachers, key=f"cover_absent_{version}")
+        if absent:
+            cover_plan = availability.plan(cover_day, absent)
+            if cover_plan:
+                st.dataframe(pd.DataFrame([{**row, "periods": ", ".join(row["periods"])} for row in cover_plan]),
+                             use_container_width=True)
+            else:
+                st.info(f"No lessons to cover on {cover_day}.")
+        teaching_periods = [period for period in timetable.periods if period not in timetable.breaks]
+        cover_period = st.selectbox("Free in period", teaching_periods, key=f"cover_period_{version}")
+        cover_subject = st.selectbox("Qualified for", ["Any subject"] + list(subject_teacher_map),
+                                     key=f"cover_subject_{version}")
+        free_now = [teacher for teacher in availability.free(
+            cover_day, cover_period, None if cover_subject == "Any subject" else cover_subject
+        ) if teacher not in absent]
+        st.write(", ".join(free_now) if free_now else "Nobody is free then.")
+    st.caption(f"⏱️Version {version} rendered in {started.elapsed * 1000:.0f} ms")
+
+
+# Display and download if generated
+if st.session_state.generate_clicked and st.session_state.generated_timetables:
+    for version, data in st.session_state.generated_timetables.items():
+        with timer.stage(f"Version {version}"):
+            show_version(version, data)
+
+# --- Diagnostics: where this rerun spent its time and memory ---
+if st.sidebar.toggle("📊Diagnostics", key="show_diagnostics"):
+    with st.sidebar.container(border=True):
+        # One "counts" column instead of a sparse column per count name
+        diagnostics = [{"phase": row.pop("phase"), "calls": row.pop("calls"), "ms": row.pop("ms"),
+                        "peak KB": row.pop("peak_kb"), "counts": ", ".join(f"{k} {v}" for k, v in row.items())}
+                       for row in timer.rows()]
+        st.dataframe(pd.DataFrame(diagnostics), hide_index=True, use_container_width=True)
+        st.caption(f"Run {timer.run_id} · whole rerun {timer.elapsed * 1000:.0f} ms · "
+                   "phases nest, so their times overlap")
+        st.checkbox("Measure allocations (peak KB per phase; slows every run)", key="measure_allocations",
+                    help="Uses tracemalloc for the whole server process while any session has it ticked")
+        st.checkbox("Profile the next Generate (cProfile + tracemalloc)", key="profile_generate")
+        for kind, path in st.session_state.get("profile_paths", {}).items():
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    st.download_button(f"⬇️{os.path.basename(path)}", f.read(), file_name=os.path.basename(path),
+                                       key=f"download_{kind}", on_click="ignore")
@@ -0,0 +1 @@
+"""Synthetic workbooks and the loader/solver/exporter benchmark suite (``python -m benchmarks.run``)."""
@@ -0,0 +1,237 @@
+"""Benchmark the loader, solver and exporter on synthetic workbooks against a stored baseline.
+
+For every layout and scale a synthetic workbook (:mod:`benchmarks.synthetic`)
+is written to a temporary directory and these cases are timed, best of
+``--repeat`` runs:
+
+- ``load``: :func:`ttg.load_excel_data` with empty caches (the openpyxl parse)
+- ``load snapshot``: the same workbook from its on-disk snapshot
+- ``solve single``: :func:`ttg.generate_timetable` for one class
+- ``solve whole``: :func:`ttg.generate_institution_timetables` over every class
+- ``export class``: :func:`ttg.class_workbook` for up to 20 classes
+- ``export zip``: :func:`ttg.write_zip` of the whole timetable (up to ``--zip-limit`` classes)
+
+Each case reports its throughput and the peak of traced memory (from one
+extra run under tracemalloc, so the timings are not slowed by it); the
+whole-institution solve also reports the :func:`ttg.evaluate` metrics.
+Cases slower or using more memory than the baseline by more than the
+thresholds, or placing fewer periods, are regressions and make the exit
+status 1.
+
+Example::
+
+    python -m benchmarks.run --scales 10,100 --layouts school
+    python -m benchmarks.run --save-baseline
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from ttg import (DAYS_OPTIONS, build_breaks, class_workbook, compile_calendar,
+                 evaluate, generate_institution_timetables, generate_timetable,
+                 load_excel_data, load_workbook, plan_from_breaks, write_zip)
+from ttg.loader import INSTITUTION_TYPES, clear_memory_cache
+
+from .synthetic import write_workbook
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+EXPORT_CLASSES = 20
+# Differences below these are noise whatever the relative change
+MIN_SECONDS = 0.005
+MIN_PEAK_KB = 256
+
+
+def _run(function, repeat):
+    """``(best seconds, peak traced KB, result of the last call)``."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, round(peak / 1024, 1), result
+
+
+def _case(seconds, peak_kb, units, unit, **extra):
+    return {"seconds": round(seconds, 6), "peak_kb": peak_kb, "units": units, "unit": unit,
+            "throughput": round(units / seconds, 1) if seconds else None, **extra}
+
+
+def bench_layout(institution, n_classes, workdir, repeat=3, rooms=False, workers=1, zip_limit=100):
+    """``{case: result}`` for one synthetic workbook."""
+    path = os.path.join(workdir, f"{institution}-{n_classes}.xlsx")
+    subject_teacher_map, class_hours = write_workbook(path, institution, n_classes, rooms=rooms)
+    results = {}
+
+    def load_cold():
+        clear_memory_cache()
+        os.environ["TTG_CACHE_DIR"] = tempfile.mkdtemp(dir=workdir)
+        return load_excel_data(path, institution)
+
+    seconds, peak, (_, df_subject_hours, _) = _run(load_cold, repeat)
+    results["load"] = _case(seconds, peak, len(df_subject_hours), "allocation rows/s")
+
+    def load_snapshot():
+        clear_memory_cache()
+        return load_excel_data(path, institution)
+
+    seconds, peak, _ = _run(load_snapshot, repeat)
+    results["load snapshot"] = _case(seconds, peak, len(df_subject_hours), "allocation rows/s")
+
+    breaks = build_breaks("10:00", 15, "12:00", 30)
+    calendar = compile_calendar(DAYS_OPTIONS["Mon–Fri"], plan_from_breaks("07:45", "14:30", 45, breaks))
+    days, periods, breaks = calendar.days, calendar.periods, calendar.breaks
+    workbook = load_workbook(path, institution)
+    class_subject_hours = {f"{name} A": hours for name, hours in class_hours.items()}
+    class_rooms = {key: f"R-{key}" for key in class_subject_hours}
+    class_sizes = dict.fromkeys(class_subject_hours, 30) if rooms else None
+    demand = sum(h["TH"] + h["PR"] for hours in class_subject_hours.values() for h in hours.values())
+
+    first = next(iter(class_hours))
+    seconds, peak, _ = _run(lambda: generate_timetable(subject_teacher_map, class_hours[first], days, periods,
+                                                       breaks, "R-1", rng=random.Random(0)), repeat)
+    results["solve single"] = _case(seconds, peak, sum(h["TH"] + h["PR"] for h in class_hours[first].values()),
+                                    "periods/s")
+
+    def solve_whole():
+        return generate_institution_timetables(subject_teacher_map, class_subject_hours, days, periods, breaks,
+                                               class_rooms, rng=random.Random(0), rooms=workbook.rooms,
+                                               class_sizes=class_sizes, calendar=calendar)
+
+    seconds, peak, timetable = _run(solve_whole, repeat)
+    quality = evaluate(timetable)
+    results["solve whole"] = _case(seconds, peak, len(class_subject_hours), "classes/s",
+                                   placed=demand - quality["unplaced"], quality=quality)
+
+    keys = list(class_subject_hours)[:EXPORT_CLASSES]
+    seconds, peak, _ = _run(lambda: [class_workbook(timetable, key) for key in keys], repeat)
+    results["export class"] = _case(seconds, peak, len(keys), "workbooks/s")
+
+    if n_classes <= zip_limit:
+        seconds, peak, n_files = _run(lambda: write_zip(timetable, io.BytesIO(), workers=workers), repeat)
+        results["export zip"] = _case(seconds, peak, n_files, "workbooks/s")
+    return results
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """``[(key, message)]`` of the cases that regressed against ``baseline``."""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        slower = result["seconds"] - base["seconds"]
+        if slower > max(threshold * base["seconds"], MIN_SECONDS):
+            regressions.append((key, f"{result['seconds'] * 1000:.1f} ms vs {base['seconds'] * 1000:.1f} ms "
+                                     f"(+{slower / base['seconds']:.0%})"))
+        grown = result["peak_kb"] - base["peak_kb"]
+        if grown > max(memory_threshold * base["peak_kb"], MIN_PEAK_KB):
+            regressions.append((key, f"peak {result['peak_kb']:.0f} KB vs {base['peak_kb']:.0f} KB "
+                                     f"(+{grown / base['peak_kb']:.0%})"))
+        if "placed" in base and result["placed"] < base["placed"]:
+            regressions.append((key, f"placed {result['placed']} periods vs {base['placed']}"))
+    return regressions
+
+
+def _table(results, baseline):
+    lines = [f"{'case':<32} {'ms':>10} {'vs base':>8} {'peak KB':>10} {'throughput':>22}"]
+    for key, result in results.items():
+        base = baseline.get(key)
+        change = f"{result['seconds'] / base['seconds'] - 1:+.0%}" if base and base["seconds"] else ""
+        throughput = f"{result['throughput']:,.0f} {result['unit']}" if result["throughput"] else ""
+        lines.append(f"{key:<32} {result['seconds'] * 1000:>10.1f} {change:>8} {result['peak_kb']:>10,.0f} "
+                     f"{throughput:>22}")
+        if "quality" in result:
+            lines.append(" " * 33 + ", ".join(f"{k.replace('_', ' ')} {v:g}" for k, v in result["quality"].items()))
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description=__doc__.split("\n")[0])
+    parser.add_argument("--layouts", default=",".join(INSTITUTION_TYPES),
+                        help="Comma separated institution types (default: %(default)s)")
+    parser.add_argument("--scales", default="10,100,1000", help="Comma separated class counts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the best is kept")
+    parser.add_argument("--rooms", action="store_true", help="Give the workbooks a Rooms sheet (room allocation on)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the ZIP export")
+    parser.add_argument("--zip-limit", type=int, default=100, help="Largest scale that also times the ZIP export")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline, as a fraction (default: %(default)s)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="Allowed growth of peak memory, as a fraction (default: %(default)s)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the full results to PATH")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    layouts = args.layouts.split(",")
+    unknown = sorted(set(layouts) - set(INSTITUTION_TYPES))
+    if unknown:
+        parser.error(f"unknown layout(s): {', '.join(unknown)}")
+    scales = [int(n) for n in args.scales.split(",")]
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    cache_dir = os.environ.get("TTG_CACHE_DIR")
+    with tempfile.TemporaryDirectory(prefix="ttg-bench-") as workdir:
+        try:
+            # Lazy imports and first-use caches would otherwise land on the first case measured
+            bench_layout(layouts[0], 2, workdir, repeat=1, rooms=args.rooms)
+            for institution in layouts:
+                for n_classes in scales:
+                    cases = bench_layout(institution, n_classes, workdir, args.repeat, args.rooms, args.workers,
+                                         args.zip_limit)
+                    for case, result in cases.items():
+                        results[f"{institution}/{n_classes}/{case}"] = result
+                    print(f"{institution} x {n_classes}: done", file=sys.stderr)
+        finally:
+            if cache_dir is None:
+                os.environ.pop("TTG_CACHE_DIR", None)
+            else:
+                os.environ["TTG_CACHE_DIR"] = cache_dir
+
+    print(_table(results, baseline))
+    report = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "repeat": args.repeat, "rooms": args.rooms, "created": time.time()},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    for key, message in regressions:
+        print(f"REGRESSION {key}: {message}")
+    if baseline and not regressions:
+        print(f"no regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""Synthetic workbooks in every supported layout, at any number of classes.
+
+Classes come in cohorts of ten that share one set of subjects, listed as
+comma separated class lists on the allocation sheet like real workbooks do.
+Every subject gets enough teachers for its cohort's demand at about two
+thirds of a teacher's week, so a whole-institution solve can place all
+periods and the timings measure the engine rather than an infeasible input.
+
+Example::
+
+    python -m benchmarks.synthetic school 100 school-100.xlsx --rooms
+"""
+import argparse
+import math
+import random
+
+import xlsxwriter
+
+from ttg.loader import COACHING, COLLEGE, INSTITUTION_TYPES, SCHOOL
+
+COHORT = 10
+SUBJECTS = ["Maths", "Physics", "Chemistry", "Biology", "English", "History", "Geography", "Economics",
+            "Computer", "Hindi", "Marathi", "Drawing"]
+# Theory + practical periods per week of the first ``PRACTICAL_SUBJECTS`` subjects and of the rest:
+# 2 x (2 + 2) + 6 x 3 = 26 periods, inside the 30 teaching periods of a default Mon-Fri week
+PRACTICAL_SUBJECTS = 2
+PRACTICAL_HOURS = {"TH": 2, "PR": 2}
+THEORY_HOURS = {"TH": 3, "PR": 0}
+# Periods a teacher is planned for per week when sizing the staff
+TEACHER_LOAD = 20
+
+# Sheet and column names per layout: (mapping sheet, teacher column, allocation sheet, class column, subject column)
+LAYOUTS = {
+    SCHOOL: ("TeacherMapping", "Teachers", "CLASS-SUBJECT ALLOCATION", "Class", "Subject"),
+    COACHING: ("FACULTY-SUBJECT", "Faculty", "SUBJECTS_COACHING", "Stream", "Subject"),
+    COLLEGE: ("SUBJECTS_COLLEGE", "Faculty", "SUBJECT-ALLOCATION", "Year", "Sub"),
+}
+
+
+def class_names(institution, n_classes):
+    """Class names as the allocation sheet writes them (the school Classes sheet adds "Std.")."""
+    if institution == SCHOOL:
+        return [str(i + 1) for i in range(n_classes)]
+    width = len(str(n_classes))
+    prefix = "Stream-" if institution == COACHING else "Sem-"
+    return [f"{prefix}{i + 1:0{width}d}" for i in range(n_classes)]
+
+
+def workload(institution, n_classes, subjects_per_class=8):
+    """``(subject_teacher_map, {class name: subject_hours}, rooms rows)`` of a synthetic institution."""
+    names = class_names(institution, n_classes)
+    teacher_prefix = "T" if institution == SCHOOL else "F"
+    subject_teacher_map = {}
+    class_hours = {}
+    for cohort in range(math.ceil(n_classes / COHORT)):
+        members = names[cohort * COHORT:(cohort + 1) * COHORT]
+        hours = {}
+        for j, base in enumerate(SUBJECTS[:subjects_per_class]):
+            subject = f"{base} {cohort + 1}"
+            hours[subject] = dict(PRACTICAL_HOURS if j < PRACTICAL_SUBJECTS else THEORY_HOURS)
+            demand = len(members) * (hours[subject]["TH"] + hours[subject]["PR"])
+            subject_teacher_map[subject] = [f"{teacher_prefix}{cohort + 1}-{j + 1}-{k + 1}"
+                                            for k in range(math.ceil(demand / TEACHER_LOAD))]
+        for name in members:
+            class_hours[name] = hours
+    # One lab per four classes (each class needs two practical pairs a week), one spare lecture room per ten
+    rooms = [(f"Lab {i + 1}", "Lab", 40, "") for i in range(math.ceil(n_classes / 4))]
+    rooms += [(f"Room {i + 1}", "Lecture", 60, "") for i in range(math.ceil(n_classes / 10))]
+    return subject_teacher_map, class_hours, rooms
+
+
+def write_workbook(path, institution, n_classes, subjects_per_class=8, rooms=False, seed=0):
+    """Write a synthetic workbook and return its ``(subject_teacher_map, {class name: subject_hours})``.
+
+    ``seed`` only shuffles the row order and the spacing after commas, so
+    two seeds give different bytes (and cache keys) for the same institution.
+    """
+    rng = random.Random(seed)
+    subject_teacher_map, class_hours, room_rows = workload(institution, n_classes, subjects_per_class)
+    mapping_sheet, teacher_column, allocation_sheet, class_column, subject_column = LAYOUTS[institution]
+
+    classes_of = {}
+    for name, hours in class_hours.items():
+        for subject in hours:
+            classes_of.setdefault(subject, []).append(name)
+    allocation = [(rng.choice([", ", ","]).join(classes), subject) for subject, classes in classes_of.items()]
+    mapping = [(subject, rng.choice([", ", ","]).join(teachers)) for subject, teachers in subject_teacher_map.items()]
+    rng.shuffle(allocation)
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+
+    def sheet(name, header, rows):
+        worksheet = workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, header)
+        for r, row in enumerate(rows, start=1):
+            worksheet.write_row(r, 0, row)
+
+    sheet(mapping_sheet, ["Subject", teacher_column], mapping)
+    sheet(allocation_sheet, [class_column, subject_column], allocation)
+    if institution == SCHOOL:
+        sheet("Classes", ["Class"], [(f"Std. {name}",) for name in class_hours])
+    if rooms:
+        sheet("Rooms", ["Room", "Type", "Capacity", "Subjects"], room_rows)
+    workbook.close()
+    return subject_teacher_map, class_hours
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.synthetic", description="Write a synthetic timetable workbook.")
+    parser.add_argument("institution", choices=INSTITUTION_TYPES)
+    parser.add_argument("classes", type=int, help="Number of classes (streams, years)")
+    parser.add_argument("path", help="Output .xlsx path")
+    parser.add_argument("--subjects", type=int, default=8, help="Subjects per class (default: %(default)s)")
+    parser.add_argument("--rooms", action="store_true", help="Add a Rooms sheet with labs and spare lecture rooms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if not 1 <= args.subjects <= len(SUBJECTS):
+        parser.error(f"--subjects must be between 1 and {len(SUBJECTS)}")
+    subject_teacher_map, _ = write_workbook(args.path, args.institution, args.classes, args.subjects, args.rooms,
+                                            args.seed)
+    n_teachers = sum(len(teachers) for teachers in subject_teacher_map.values())
+    print(f"wrote {args.path}: {args.classes} classes, {len(subject_teacher_map)} subjects, {n_teachers} teachers")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,32 @@
+"""Headless timetable engine shared by the Streamlit app (TTG.py) and the batch CLI.
+
+Nothing in this package imports Streamlit or PIL.
+"""
+from .cache import (RESULT_CACHE, ResultCache, fingerprint,
+                    seed_from_fingerprint)
+from .calendar import (DEFAULT_SHIFT, Break, Calendar, DayPlan, calendar_for,
+                       compile_calendar, plan_from_breaks)
+from .cover import AvailabilityIndex
+from .export import (XLSX_MIME, class_workbook, master_workbook,
+                     teacher_workbook, timetable_filename, write_zip)
+from .feasibility import Issue, analyze
+from .grid import (KIND_EMPTY, KIND_FIXED, KIND_PR, KIND_SESSION, KIND_TH,
+                   KIND_TH_PR, PINNED_KINDS, Interner, Timetable)
+from .instrument import (Phase, StageTimer, TracingHolds, log_json, phase,
+                         profile_run, timed)
+from .loader import (COACHING, COLLEGE, DEFAULT_SECTIONS, INSTITUTION_LABELS,
+                     INSTITUTION_TYPES, SCHOOL, WorkbookData, class_subjects,
+                     expand_class_subject_allocation, load_excel_data,
+                     load_workbook, normalize_class_name,
+                     normalize_institution_type, snapshot_dir)
+from .periods import (DAYS_OPTIONS, build_breaks, count_teaching_periods,
+                      generate_period_times)
+from .rooms import LAB, LECTURE, Room, RoomPool, rooms_from_frame
+from .sessions import IntervalIndex
+from .solver import (Occupancy, generate_institution_timetables,
+                     generate_timetable)
+from .store import TimetableStore, split_class_key, store_path
+from .optimize import optimize
+from .quality import DEFAULT_WEIGHTS, evaluate
+from .repair import changed_subjects, repair
+from .versions import generate_candidates, make_job, regenerate
@@ -0,0 +1,215 @@
+"""Minute-resolution day grids, compiled once per configuration.
+
+A :data:`DayPlan` lays out one day in integer minutes: periods run back to
+back from ``start``, every break begins at its own time and lasts its real
+length, and a period that would run into a break is not scheduled (the gap
+before the break stays free). :func:`compile_calendar` merges the plans of
+every day and shift into one list of period columns shared by the timetable
+arrays, plus a bitmask per ``(shift, day)`` of the columns that are teaching
+periods there, which is what the solver walks.
+"""
+import collections
+import functools
+import re
+
+_BREAK_MINUTES = re.compile(r"\((\d+) min\)")
+
+# Shift used by classes that are not assigned one
+DEFAULT_SHIFT = ""
+
+Break = collections.namedtuple("Break", ["start", "minutes", "label"])
+DayPlan = collections.namedtuple("DayPlan", ["start", "end", "duration", "breaks"])
+
+
+def to_minutes(hhmm):
+    hours, minutes = str(hhmm).strip()[:5].split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def break_minutes(label):
+    """Length of a break from its label, e.g. ``"Lunch Break (30 min)"`` -> 30."""
+    match = _BREAK_MINUTES.search(str(label))
+    return int(match.group(1)) if match else 0
+
+
+def plan_from_breaks(start, end, duration, breaks):
+    """:data:`DayPlan` from ``"HH:MM"`` times and a :func:`~ttg.periods.build_breaks` dict."""
+    return DayPlan(
+        to_minutes(start), to_minutes(end), int(duration),
+        tuple(sorted(Break(to_minutes(at), break_minutes(label), label) for at, label in breaks.items())),
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def day_slots(plan):
+    """``((start, end, is_break, break label or None), ...)`` for one day, in time order."""
+    slots = []
+    now = plan.start
+    for brk in sorted(plan.breaks) + [None]:
+        limit = plan.end if brk is None else min(brk.start, plan.end)
+        while now + plan.duration <= limit:
+            slots.append((now, now + plan.duration, False, None))
+            now += plan.duration
+        if brk is None or brk.start >= plan.end:
+            break
+        if brk.start < plan.start:
+            continue
+        start = max(brk.start, now)
+        end = min(start + brk.minutes, plan.end)
+        slots.append((start, end, True, brk.label))
+        now = max(now, end)
+    return tuple(slots)
+
+
+class Calendar:
+    """Period columns shared by every day and shift, with per-day teaching masks.
+
+    ``periods`` are the column labels (``"HH:MM - HH:MM"`` for a period,
+    ``"HH:MM"`` for a break, as before) and ``intervals`` their minutes.
+    Bit ``i`` of :meth:`open_mask` is set when column ``i`` is a teaching
+    period on that day of that shift. A practical pair needs two adjacent
+    open columns, which every single-grid day has.
+    """
+
+    def __init__(self, days, columns, open_masks, break_masks, key):
+        # columns: (start, end, label, break name or None)
+        self.days = list(days)
+        self.periods = [label for _, _, label, _ in columns]
+        self.intervals = [(start, end) for start, end, _, _ in columns]
+        self.is_break = [name is not None for _, _, _, name in columns]
+        self.breaks = {label: name for _, _, label, name in columns if name is not None}
+        self.shifts = list(open_masks)
+        self._open = open_masks
+        self._break = break_masks
+        self._any_open = [0] * len(self.days)
+        for masks in open_masks.values():
+            self._any_open = [a | m for a, m in zip(self._any_open, masks)]
+        self.key = key
+
+    def __repr__(self):
+        return f"Calendar({self.key!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Calendar) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def _shift(self, masks, shift):
+        shift = DEFAULT_SHIFT if shift is None else shift
+        if shift not in masks:
+            raise ValueError(f"Unknown shift {shift!r}; the calendar has {', '.join(map(repr, self.shifts))}")
+        return masks[shift]
+
+    def open_mask(self, day, shift=None):
+        return self._shift(self._open, shift)[day]
+
+    def break_mask(self, day, shift=None):
+        return self._shift(self._break, shift)[day]
+
+    def any_open_mask(self, day):
+        """Columns that are a teaching period on ``day`` in any shift (what a teacher can give)."""
+        return self._any_open[day]
+
+    def runs(self, day, shift=None):
+        """Lengths of the stretches of adjacent teaching columns on ``day``."""
+        mask = self.open_mask(day, shift)
+        runs = []
+        while mask:
+            mask >>= (mask & -mask).bit_length() - 1
+            length = (~mask & (mask + 1)).bit_length() - 1
+            runs.append(length)
+            mask >>= length
+        return runs
+
+    def teaching_slots(self, shift=None):
+        return sum(bin(self.open_mask(d, shift)).count("1") for d in range(len(self.days)))
+
+    def pair_slots(self, shift=None):
+        return sum(run // 2 for d in range(len(self.days)) for run in self.runs(d, shift))
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(days, shifts):
+    columns = {}
+    for _, plans in shifts:
+        for plan in plans:
+            for start, end, is_break, name in day_slots(plan) if plan else ():
+                # Breaks starting at the same minute share one column
+                key = (start, -1, True) if is_break else (start, end, False)
+                if key not in columns:
+                    label = format_minutes(start) if is_break else f"{format_minutes(start)} - {format_minutes(end)}"
+                    columns[key] = (start, end, label, name)
+    order = sorted(columns, key=lambda k: (columns[k][0], columns[k][1]))
+    index = {k: i for i, k in enumerate(order)}
+
+    open_masks, break_masks = {}, {}
+    for shift, plans in shifts:
+        open_masks[shift], break_masks[shift] = [], []
+        for plan in plans:
+            teaching = breaks = 0
+            for start, end, is_break, _ in day_slots(plan) if plan else ():
+                if is_break:
+                    breaks |= 1 << index[(start, -1, True)]
+                else:
+                    teaching |= 1 << index[(start, end, False)]
+            open_masks[shift].append(teaching)
+            break_masks[shift].append(breaks)
+
+    # One shared grid only works if shifts never teach at overlapping minutes on the same day
+    intervals = [columns[k][:2] for k in order]
+    for d, day in enumerate(days):
+        seen = []
+        for shift in open_masks:
+            mask = open_masks[shift][d]
+            for i in (i for i in range(len(order)) if mask >> i & 1):
+                for other, j in seen:
+                    if other != shift and intervals[i][0] < intervals[j][1] and intervals[j][0] < intervals[i][1]:
+                        raise ValueError(f"Shifts {other!r} and {shift!r} overlap on {day} "
+                                         f"({format_minutes(intervals[j][0])} and {format_minutes(intervals[i][0])})")
+                seen.append((shift, i))
+    return Calendar(days, [columns[k] for k in order], open_masks, break_masks, (days, shifts))
+
+
+def compile_calendar(days, plan, day_plans=None, shifts=None):
+    """Compile (or fetch the cached) :class:`Calendar` for one configuration.
+
+    ``plan`` is the :data:`DayPlan` of every day; ``day_plans`` overrides it
+    per day name (e.g. a short Saturday), with ``None`` for a day off.
+    ``shifts`` maps further shift names to their own ``(plan, day_plans)``;
+    the main plan is the :data:`DEFAULT_SHIFT`. Raises ``ValueError`` when
+    two shifts teach at overlapping times on the same day.
+    """
+    day_plans = day_plans or {}
+    key_shifts = [(DEFAULT_SHIFT, tuple(day_plans.get(day, plan) for day in days))]
+    for name, (shift_plan, shift_days) in (shifts or {}).items():
+        shift_days = shift_days or {}
+        key_shifts.append((name, tuple(shift_days.get(day, shift_plan) for day in days)))
+    return _compile(tuple(days), tuple(key_shifts))
+
+
+@functools.lru_cache(maxsize=64)
+def _calendar_for(days, periods, breaks):
+    labels = dict(breaks)
+    columns = []
+    for period in periods:
+        if " - " in period:
+            start, end = period.split(" - ")
+            columns.append((to_minutes(start), to_minutes(end), period, None))
+        else:
+            start = to_minutes(period)
+            name = labels.get(period, period)
+            columns.append((start, start + break_minutes(name), period, name))
+    teaching = sum(1 << i for i, column in enumerate(columns) if column[3] is None)
+    breaks_mask = sum(1 << i for i, column in enumerate(columns) if column[3] is not None)
+    return Calendar(days, columns, {DEFAULT_SHIFT: [teaching] * len(days)},
+                    {DEFAULT_SHIFT: [breaks_mask] * len(days)}, ("labels", days, periods, breaks))
+
+
+def calendar_for(days, periods, breaks):
+    """Uniform :class:`Calendar` for period labels made elsewhere (every day has the same grid)."""
+    return _calendar_for(tuple(days), tuple(periods), tuple(breaks.items()))
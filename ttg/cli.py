@@ -0,0 +1,296 @@
+"""Batch command line: read a workbook once and write a timetable for every class/section.
+
+Example::
+
+    python -m ttg timetable.xlsx --institution school --out timetables/
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+
+from .cache import fingerprint
+from .calendar import compile_calendar, plan_from_breaks, to_minutes
+from .export import class_workbook, safe_filename, timetable_filename, write_zip
+from .feasibility import analyze
+from .instrument import StageTimer, log_json, profile_run
+from .loader import (DEFAULT_SECTIONS, INSTITUTION_TYPES, class_subjects,
+                     load_workbook, normalize_class_name)
+from .periods import DAYS_OPTIONS, build_breaks
+from .solver import generate_institution_timetables
+from .store import TimetableStore, store_path
+from .versions import draw_seeds, generate_candidates, make_job, regenerate
+
+
+def load_hours_file(path):
+    """Read subject hours from JSON (or take the same mapping already parsed).
+
+    The file maps subject -> {"TH": n, "PR": n}; an optional ``"classes"`` key
+    holds per-class overrides in the same shape.
+    """
+    if not path:
+        return {}, {}
+    if isinstance(path, dict):
+        data = dict(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    per_class = data.pop("classes", {})
+    return data, per_class
+
+
+def clock_time(value):
+    """argparse ``type`` for ``HH:MM`` times; returns the text unchanged once it parses."""
+    try:
+        hours, minutes = divmod(to_minutes(value), 60)
+    except ValueError:
+        hours = minutes = -1
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and ":" in value):
+        raise argparse.ArgumentTypeError(f"expected an HH:MM time, got {value!r}")
+    return value
+
+
+def class_subject_hours_for(subjects, class_name, default_th, default_pr, hours, per_class_hours):
+    subject_hours = {}
+    overrides = per_class_hours.get(class_name, {})
+    for subject in subjects:
+        entry = overrides.get(subject) or hours.get(subject) or {}
+        subject_hours[subject] = {
+            "TH": int(entry.get("TH", default_th)),
+            "PR": int(entry.get("PR", default_pr)),
+        }
+    return subject_hours
+
+
+# Solve inputs built from the options; ``class_specs`` maps class key -> (class, section, subject hours)
+Prepared = collections.namedtuple(
+    "Prepared", ["workbook", "class_specs", "class_rooms", "class_shifts", "calendar", "report", "job", "skipped"])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ttg", description="Generate timetables for every class/section in a workbook.")
+    parser.add_argument("workbook", help="Path to the .xlsx workbook")
+    parser.add_argument("--institution", choices=INSTITUTION_TYPES, default="school")
+    parser.add_argument("--out", default="timetables", help="Output directory (default: %(default)s)")
+    parser.add_argument("--sections", help="Comma separated sections (default depends on institution type)")
+    parser.add_argument("--classes", help="Comma separated subset of classes to generate")
+    parser.add_argument("--days", choices=list(DAYS_OPTIONS), default="Mon–Fri")
+    parser.add_argument("--start", type=clock_time, default="07:45", help="Day start time HH:MM")
+    parser.add_argument("--end", type=clock_time, default="14:30", help="Day end time HH:MM")
+    parser.add_argument("--duration", type=int, default=60, help="Period duration in minutes")
+    parser.add_argument("--day-end", action="append", default=[], metavar="DAY=HH:MM",
+                        help="Different end time for one day, e.g. Saturday=12:00 (repeatable)")
+    parser.add_argument("--shift", action="append", default=[], metavar="NAME=HH:MM-HH:MM",
+                        help="Extra shift with its own hours; breaks inside it still apply (repeatable)")
+    parser.add_argument("--class-shift", action="append", default=[], metavar="CLASS=NAME",
+                        help="Put every section of a class in a shift (repeatable)")
+    parser.add_argument("--short-break", type=clock_time, default="10:00")
+    parser.add_argument("--short-break-duration", type=int, default=15)
+    parser.add_argument("--lunch-break", type=clock_time, default="12:00")
+    parser.add_argument("--lunch-break-duration", type=int, default=30)
+    parser.add_argument("--th", type=int, default=3, help="Default theory hours per subject")
+    parser.add_argument("--pr", type=int, default=0, help="Default practical hours per subject")
+    parser.add_argument("--hours", help="JSON file with per-subject (and per-class) TH/PR hours")
+    parser.add_argument("--room", default="{class}-{section}",
+                        help="Classroom template, may use {class} and {section} (default: %(default)s)")
+    parser.add_argument("--class-size", type=int, default=0,
+                        help="Students per class, matched against room capacities from the Rooms sheet (0 = ignore)")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible teacher choices")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="Solve this many seeded candidates and keep the best (default: %(default)s)")
+    parser.add_argument("--keep", type=int, default=1, help="Number of best candidates to export as versions")
+    parser.add_argument("--optimize-moves", type=int, default=0,
+                        help="Simulated-annealing moves applied to each solution (0 = greedy only)")
+    parser.add_argument("--workers", type=int, help="Worker processes for --candidates (default: CPU count)")
+    parser.add_argument("--independent", action="store_true",
+                        help="Solve each class on its own (teachers may be double-booked across classes)")
+    parser.add_argument("--zip", action="store_true",
+                        help="Write one ZIP per version with class, teacher and master workbooks")
+    parser.add_argument("--save", action="store_true",
+                        help=f"Also keep every version in the local timetable store ({store_path()}, or $TTG_STORE)")
+    parser.add_argument("--log-json", nargs="?", const="-", metavar="PATH",
+                        help="Log every phase (time, allocations, counts) as one JSON line to PATH (default: stderr)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="Write a cProfile (.prof), top allocations and phase totals of this run to DIR")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    StageTimer().install()
+    if args.log_json:
+        log_json(args.log_json)
+    if not args.profile:
+        return _generate(parser, args)
+    with profile_run(args.profile) as paths:
+        status = _generate(parser, args)
+    print(f"profile written to {paths['profile']} (allocations: {paths['allocations']})", file=sys.stderr)
+    return status
+
+
+def prepare(args, error):
+    """Read the workbook and build the solve inputs the options in ``args`` describe.
+
+    ``args`` carries the options of :func:`build_parser` (the job server
+    fills the same names from a request); ``error(message)`` reports a bad
+    option and must not return. Returns a :data:`Prepared` whose ``job`` is
+    the shared-timetable job for :func:`~ttg.versions.regenerate`.
+    """
+    workbook = load_workbook(args.workbook, args.institution)
+    df_subject_hours, df_classes = workbook.df_subject_hours, workbook.df_classes
+    hours, per_class_hours = load_hours_file(args.hours)
+
+    breaks = build_breaks(args.short_break, args.short_break_duration, args.lunch_break, args.lunch_break_duration)
+    days = DAYS_OPTIONS[args.days]
+    plan = plan_from_breaks(args.start, args.end, args.duration, breaks)
+    day_plans = {}
+    for spec in args.day_end:
+        day, sep, end = spec.partition("=")
+        if not sep:
+            error(f"--day-end: expected DAY=HH:MM, got {spec!r}")
+        if day not in days:
+            error(f"--day-end: {day!r} is not one of the working days")
+        try:
+            day_plans[day] = plan._replace(end=to_minutes(end))
+        except ValueError:
+            error(f"--day-end: {end!r} is not an HH:MM time")
+    shifts = {}
+    for spec in args.shift:
+        name, sep, window = spec.partition("=")
+        start, dash, end = window.partition("-")
+        if not (sep and dash):
+            error(f"--shift: expected NAME=HH:MM-HH:MM, got {spec!r}")
+        try:
+            shifts[name] = (plan_from_breaks(start, end, args.duration, breaks), None)
+        except ValueError:
+            error(f"--shift: {window!r} is not an HH:MM-HH:MM window")
+    try:
+        calendar = compile_calendar(days, plan, day_plans, shifts)
+    except ValueError as e:
+        error(str(e))
+    periods, breaks = calendar.periods, calendar.breaks
+    shift_of = {normalize_class_name(c): name for c, _, name in (spec.partition("=") for spec in args.class_shift)}
+    unknown = sorted(set(shift_of.values()) - set(shifts))
+    if unknown:
+        error(f"--class-shift: unknown shift(s) {', '.join(unknown)}")
+
+    sections = args.sections.split(",") if args.sections else DEFAULT_SECTIONS[args.institution]
+    classes = [normalize_class_name(c) for c in df_classes['Class'].unique()]
+    if args.classes:
+        wanted = {normalize_class_name(c) for c in args.classes.split(",")}
+        classes = [c for c in classes if c in wanted]
+
+    class_specs = {}
+    class_rooms = {}
+    class_shifts = {}
+    skipped = []
+    for class_name in classes:
+        subjects = class_subjects(df_subject_hours, class_name)
+        if not subjects:
+            skipped.append(class_name)
+            continue
+        subject_hours = class_subject_hours_for(subjects, class_name, args.th, args.pr, hours, per_class_hours)
+        for section in sections:
+            class_key = f"{class_name} {section}"
+            class_specs[class_key] = (class_name, section, subject_hours)
+            try:
+                class_rooms[class_key] = args.room.format(**{"class": class_name, "section": section})
+            except (KeyError, IndexError, ValueError) as e:
+                error(f"--room: {args.room!r} is not a valid template; use {{class}} and {{section}} ({e!r})")
+            if class_name in shift_of:
+                class_shifts[class_key] = shift_of[class_name]
+
+    class_subject_hours = {k: v[2] for k, v in class_specs.items()}
+    report = analyze(workbook.subject_teacher_map, class_subject_hours, days, periods, breaks,
+                     class_rooms if not args.independent else None, rooms=workbook.rooms,
+                     calendar=calendar, class_shifts=class_shifts)
+    job = make_job(workbook.subject_teacher_map, class_subject_hours, days, periods, breaks,
+                   class_rooms, optimize_moves=args.optimize_moves, rooms=workbook.rooms,
+                   class_sizes=dict.fromkeys(class_specs, args.class_size), calendar=calendar,
+                   class_shifts=class_shifts)
+    return Prepared(workbook, class_specs, class_rooms, class_shifts, calendar, report, job, skipped)
+
+
+def _generate(parser, args):
+    if args.zip and args.independent:
+        parser.error("--zip needs one shared timetable; drop --independent")
+    if args.save and args.independent:
+        parser.error("--save needs one shared timetable; drop --independent")
+
+    workbook, class_specs, class_rooms, class_shifts, calendar, report, job, skipped = prepare(args, parser.error)
+    subject_teacher_map = workbook.subject_teacher_map
+    days, periods, breaks = calendar.days, calendar.periods, calendar.breaks
+    for class_name in skipped:
+        print(f"skipping {class_name}: no subjects allocated", file=sys.stderr)
+    if not class_specs:
+        parser.error("no classes to schedule: none match --classes or have subjects allocated")
+    for issue in report["issues"]:
+        if not (args.independent and issue.kind == "teachers"):
+            print(f"pre-check: {issue.message}", file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+
+    if args.independent:
+        solved = [
+            (class_key, generate_institution_timetables(
+                subject_teacher_map, {class_key: subject_hours}, days, periods, breaks,
+                {class_key: class_rooms[class_key]}, rng=rng, rooms=workbook.rooms,
+                class_sizes={class_key: args.class_size}, calendar=calendar,
+                class_shifts={class_key: class_shifts[class_key]} if class_key in class_shifts else None
+            ), None)
+            for class_key, (_, _, subject_hours) in class_specs.items()
+        ]
+    else:
+        if args.candidates > 1 or args.keep > 1:
+            best = generate_candidates(job, max(args.candidates, args.keep), top_k=args.keep,
+                                       base_seed=args.seed, workers=args.workers)
+        else:
+            # A drawn seed keeps the version reproducible (and distinct in the store)
+            seed = args.seed if args.seed is not None else draw_seeds(1)[0]
+            best = [{"seed": seed, "metrics": None, "timetable": regenerate(job, seed)}]
+        for version, candidate in enumerate(best, start=1):
+            if candidate["metrics"]:
+                print(f"version {version}: seed {candidate['seed']} score {candidate['metrics']['score']:g}")
+        solved = [
+            (class_key, candidate["timetable"], version if len(best) > 1 else None)
+            for version, candidate in enumerate(best, start=1)
+            for class_key in class_specs
+        ]
+
+    for class_key, timetable, version in solved:
+        unplaced = timetable.unplaced.get(class_key)
+        if unplaced:
+            missing = ", ".join(f"{s} x{n}" for s, n in unplaced.items())
+            print(f"{class_key}: could not place {missing}", file=sys.stderr)
+
+    if args.save:
+        store = TimetableStore()
+        for version, candidate in enumerate(best, start=1):
+            version_id = store.save(
+                candidate["timetable"], fingerprint(workbook.digest, candidate["seed"], [job]),
+                seed=candidate["seed"], label=f"{os.path.basename(args.workbook)} · V{version}",
+                metrics=candidate["metrics"],
+                extra={"class_key": next(iter(class_specs)), "seed": candidate["seed"], "jobs": [job]},
+            )
+            print(f"version {version}: saved as #{version_id} in {store.path}")
+
+    if args.zip:
+        for version, candidate in enumerate(best, start=1):
+            suffix = f"_V{version}" if len(best) > 1 else ""
+            path = os.path.join(args.out, f"Timetables{suffix}.zip")
+            n_files = write_zip(candidate["timetable"], path, workers=args.workers)
+            print(f"wrote {n_files} workbooks to {path}")
+        return 0
+
+    for class_key, timetable, version in solved:
+        class_name, section, _ = class_specs[class_key]
+        path = os.path.join(args.out, safe_filename(timetable_filename(class_name, section, version)))
+        with open(path, "wb") as f:
+            f.write(class_workbook(timetable, class_key))
+
+    print(f"wrote {len(solved)} timetables to {args.out}")
+    return 0
@@ -0,0 +1,125 @@
+"""Who is free when: teacher availability bitsets and a substitute planner for absences.
+
+For every ``(day, period)`` the index keeps one integer whose bit ``i`` is
+set while teacher ``i`` is teaching, and for every subject one integer of
+the teachers qualified for it. "Who can cover Physics on Tuesday in period
+3" is then ``qualified & ~busy`` plus a walk over the set bits.
+"""
+from .grid import EMPTY
+from .solver import UNASSIGNED_TEACHER
+
+
+def _bit_indexes(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class AvailabilityIndex:
+    """Availability of every teacher in ``timetable`` (and in ``subject_teacher_map``).
+
+    ``day`` arguments take a day name or index and ``period`` arguments a
+    period label or column index, as in ``timetable.days``/``timetable.periods``.
+    """
+
+    def __init__(self, timetable, subject_teacher_map):
+        self.tt = timetable
+        names = [t for t in timetable.teachers.names if t != UNASSIGNED_TEACHER]
+        names += sorted({t for ts in subject_teacher_map.values() for t in ts or []} - set(names) - {UNASSIGNED_TEACHER})
+        self.teachers = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.everyone = (1 << len(names)) - 1
+        n_days, n_periods = len(timetable.days), len(timetable.periods)
+        self.busy = [[0] * n_periods for _ in range(n_days)]
+        self.day_load = [[0] * n_days for _ in names]
+
+        # Interned teacher id -> index bit, so the scan below is plain integer work
+        bit_of = {timetable.teachers.get(name): 1 << i for i, name in enumerate(names) if name in timetable.teachers}
+        d, p, c = (timetable.teacher != EMPTY).nonzero()
+        for day, period, tid in zip(d.tolist(), p.tolist(), timetable.teacher[d, p, c].tolist()):
+            bit = bit_of.get(tid)
+            if bit is not None and not self.busy[day][period] & bit:
+                self.busy[day][period] |= bit
+                self.day_load[bit.bit_length() - 1][day] += 1
+
+        self.qualified = {}
+        for subject, teachers in subject_teacher_map.items():
+            self.qualified[subject] = sum(1 << self.index[t] for t in teachers or [] if t in self.index)
+
+    def _day(self, day):
+        return day if isinstance(day, int) else self.tt.days.index(day)
+
+    def _period(self, period):
+        return period if isinstance(period, int) else self.tt.periods.index(period)
+
+    def _names(self, bits, day):
+        """Teacher names for the set ``bits``, least loaded on ``day`` first."""
+        return sorted((self.teachers[i] for i in _bit_indexes(bits)),
+                      key=lambda t: (self.day_load[self.index[t]][day], t))
+
+    def free(self, day, period, subject=None):
+        """Teachers free in that slot (qualified for ``subject`` when given), least loaded that day first."""
+        d, p = self._day(day), self._period(period)
+        bits = self.everyone & ~self.busy[d][p]
+        if subject is not None:
+            bits &= self.qualified.get(subject, 0)
+        return self._names(bits, d)
+
+    def is_free(self, teacher, day, period):
+        return not self.busy[self._day(day)][self._period(period)] >> self.index[teacher] & 1
+
+    def plan(self, day, absent):
+        """Load-balanced cover for every lesson the ``absent`` teachers have on ``day``.
+
+        Consecutive periods of one class and subject (e.g. a practical pair)
+        are covered by the same substitute. A qualified free teacher with the
+        fewest periods that day (lessons plus covers already given) is
+        preferred; when none is free, any free teacher is suggested and the
+        row is marked unqualified. Returns a list of dicts with ``class``,
+        ``periods``, ``subject``, ``absent``, ``substitute`` (``None`` when
+        nobody is free) and ``qualified``.
+        """
+        tt = self.tt
+        d = self._day(day)
+        absent_bits = sum(1 << self.index[t] for t in absent if t in self.index)
+        load = [row[d] for row in self.day_load]
+        busy = list(self.busy[d])
+
+        lessons = []
+        for teacher in absent:
+            tid = tt.teachers.get(teacher)
+            if tid == EMPTY:
+                continue
+            periods, classes = (tt.teacher[d] == tid).nonzero()
+            for p, c in sorted(zip(periods.tolist(), classes.tolist()), key=lambda pc: (pc[1], pc[0])):
+                subject = tt.subjects[tt.subject[d, p, c]]
+                last = lessons[-1] if lessons else None
+                if last and last["c"] == c and last["subject"] == subject and last["p"][-1] == p - 1:
+                    last["p"].append(p)
+                else:
+                    lessons.append({"c": c, "p": [p], "subject": subject, "absent": teacher})
+
+        plan = []
+        for lesson in sorted(lessons, key=lambda lesson: (lesson["p"][0], lesson["c"])):
+            free = self.everyone & ~absent_bits
+            for p in lesson["p"]:
+                free &= ~busy[p]
+            qualified = free & self.qualified.get(lesson["subject"], 0)
+            pick = qualified or free
+            substitute = None
+            if pick:
+                i = min(_bit_indexes(pick), key=lambda i: (load[i], self.teachers[i]))
+                substitute = self.teachers[i]
+                load[i] += len(lesson["p"])
+                for p in lesson["p"]:
+                    busy[p] |= 1 << i
+            plan.append({
+                "class": tt.classes[lesson["c"]],
+                "periods": [tt.periods[p] for p in lesson["p"]],
+                "subject": lesson["subject"],
+                "absent": lesson["absent"],
+                "substitute": substitute,
+                "qualified": bool(qualified),
+            })
+        return plan
@@ -0,0 +1,236 @@
+"""Excel export, streamed row by row through xlsxwriter's constant-memory mode.
+
+A sheet is described as ``(name, header, rows)`` where ``rows`` is an
+iterable of lists (first cell is the row label). Rows are generated straight
+from the timetable arrays, so no per-teacher DataFrame is ever built and the
+writer only holds one row at a time.
+"""
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import xlsxwriter
+
+from .grid import EMPTY, KIND_LABELS
+from .instrument import phase, timed
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CLASS_SHEET = "Class Timetable"
+
+_SHEET_NAME_MAX = 31
+_INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+_INVALID_FILE_CHARS = re.compile(r'[\\/:*?"<>|]+')
+MASTER_WORKBOOK = "Master_Timetable.xlsx"
+
+
+def unique_sheet_name(name, used):
+    """Excel-safe sheet name that is not yet in ``used`` (a set of lower-cased names).
+
+    Invalid characters are replaced, names are cut to 31 characters and
+    collisions (Excel compares case-insensitively) get a ``~2``, ``~3``... suffix.
+    """
+    base = _INVALID_SHEET_CHARS.sub("_", str(name)).strip("'").strip() or "Sheet"
+    candidate = base[:_SHEET_NAME_MAX]
+    n = 1
+    while candidate.lower() in used:
+        n += 1
+        suffix = f"~{n}"
+        candidate = base[:_SHEET_NAME_MAX - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def write_workbook(output, sheets):
+    """Stream ``sheets`` into ``output`` (a path or binary file object)."""
+    with phase("export workbook") as call:
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+        header_format = workbook.add_format({"bold": True, "border": 1})
+        break_format = workbook.add_format({"bg_color": "#FFB6C1"})  # lightpink, as on screen
+        used = set()
+        for name, header, rows in sheets:
+            worksheet = workbook.add_worksheet(unique_sheet_name(name, used))
+            worksheet.set_column(0, 0, 12)
+            worksheet.set_column(1, max(len(header), 1), 28)
+            worksheet.write_row(0, 0, [""] + list(header), header_format)
+            for r, row in enumerate(rows, start=1):
+                worksheet.write_string(r, 0, str(row[0]), header_format)
+                for col, value in enumerate(row[1:], start=1):
+                    if value:
+                        worksheet.write_string(r, col, value, break_format if "Break" in value else None)
+        workbook.close()
+        call.count(sheets=len(used))
+
+
+def _to_bytes(sheets):
+    output = io.BytesIO()
+    write_workbook(output, sheets)
+    return output.getvalue()
+
+
+# --- Sheet sources built from a Timetable ---
+def class_sheet(timetable, class_key, name=CLASS_SHEET):
+    frame = timetable.class_frame(class_key)
+    rows = ([day] + frame.iloc[d].tolist() for d, day in enumerate(timetable.days))
+    return name, timetable.periods, rows
+
+
+def teacher_sheets(timetable, teachers=None):
+    """One sheet per teacher, generated lazily from a single sort of the teacher array."""
+    d, p, c = np.nonzero(timetable.teacher != EMPTY)
+    t = timetable.teacher[d, p, c]
+    if teachers is not None:
+        keep = np.isin(t, [timetable.teachers.get(name) for name in teachers])
+        d, p, c, t = d[keep], p[keep], c[keep], t[keep]
+    order = np.lexsort((p, d, t))
+    d, p, c, t = d[order], p[order], c[order], t[order]
+    bounds = np.flatnonzero(np.diff(t)) + 1
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(t)]):
+        if lo < hi:
+            yield _teacher_sheet(timetable, int(t[lo]), d[lo:hi], p[lo:hi], c[lo:hi])
+
+
+def _teacher_sheet(timetable, tid, d, p, c):
+    columns = np.unique(p)
+    position = {int(period): i for i, period in enumerate(columns)}
+    header = [timetable.periods[i] for i in columns]
+
+    def rows():
+        k = 0
+        for day_index, day in enumerate(timetable.days):
+            row = [""] * len(columns)
+            while k < len(d) and d[k] == day_index:
+                row[position[int(p[k])]] = _teacher_label(timetable, d[k], p[k], c[k])
+                k += 1
+            yield [day] + row
+
+    return timetable.teachers[tid], header, rows()
+
+
+def _teacher_label(timetable, d, p, c):
+    subject = timetable.subjects[timetable.subject[d, p, c]]
+    room = timetable.rooms[timetable.room[d, p, c]]
+    return f"{subject} {KIND_LABELS[timetable.kind[d, p, c]]} {timetable.classes[c]} [{room}]"
+
+
+# --- Excel export: class sheet followed by one sheet per teacher ---
+def class_workbook(timetable, class_key, output=None):
+    """One class of a :class:`~ttg.grid.Timetable` plus the full weeks of its teachers.
+
+    Returns xlsx bytes, or writes to ``output`` (path or file object) when given.
+    """
+    sheets = [class_sheet(timetable, class_key)]
+    sheets += teacher_sheets(timetable, timetable.class_teachers(class_key))
+    if output is not None:
+        write_workbook(output, sheets)
+        return None
+    return _to_bytes(sheets)
+
+
+def teacher_workbook(timetable, teacher, output):
+    write_workbook(output, teacher_sheets(timetable, [teacher]))
+
+
+def master_workbook(timetable, output):
+    """Every class sheet followed by every teacher sheet, in one workbook."""
+    classes = (class_sheet(timetable, class_key, name=class_key) for class_key in timetable.classes.names)
+    write_workbook(output, itertools.chain(classes, teacher_sheets(timetable)))
+
+
+def timetable_filename(class_name, section, version=None):
+    suffix = f"_V{version}" if version is not None else ""
+    return f"{class_name}_{section}_Timetable{suffix}.xlsx"
+
+
+def safe_filename(name):
+    return _INVALID_FILE_CHARS.sub("-", str(name)).strip()
+
+
+# --- Whole-school ZIP: workbooks built in parallel, streamed into the archive ---
+_zip_timetable = None  # set once per pool worker
+
+
+def _init_zip_worker(timetable):
+    global _zip_timetable
+    _zip_timetable = timetable
+
+
+def _build_entry(task, timetable=None):
+    kind, key, path = task
+    timetable = timetable if timetable is not None else _zip_timetable
+    if kind == "class":
+        class_workbook(timetable, key, output=path)
+    elif kind == "teacher":
+        teacher_workbook(timetable, key, path)
+    else:
+        master_workbook(timetable, path)
+    return path
+
+
+def zip_entries(timetable):
+    """``(kind, key, arcname)`` for every file the whole-school archive holds."""
+    entries = [("master", None, MASTER_WORKBOOK)]
+    used = set()
+    for kind, folder, names in (("class", "classes", timetable.classes.names),
+                                ("teacher", "teachers", timetable.teachers.names)):
+        for name in names:
+            base = safe_filename(name) or kind
+            arcname = f"{folder}/{base}.xlsx"
+            n = 1
+            while arcname.lower() in used:
+                n += 1
+                arcname = f"{folder}/{base}~{n}.xlsx"
+            used.add(arcname.lower())
+            entries.append((kind, name, arcname))
+    return entries
+
+
+@timed("export zip", lambda n_files: {"files": n_files})
+def write_zip(timetable, output, workers=None):
+    """Write one workbook per class and per teacher plus a master workbook into a ZIP.
+
+    Workbooks are built by up to ``workers`` processes (``1`` = in-process)
+    into temporary files and copied into the archive as they finish, with at
+    most two pending per worker, so memory stays flat however many classes
+    and teachers there are. Returns the number of files written.
+    """
+    workers = workers or os.cpu_count() or 1
+    entries = zip_entries(timetable)
+    tmpdir = tempfile.mkdtemp(prefix="ttg-zip-")
+    tasks = [(kind, key, os.path.join(tmpdir, f"{i}.xlsx")) for i, (kind, key, _) in enumerate(entries)]
+    arcnames = {task[2]: arcname for task, (_, _, arcname) in zip(tasks, entries)}
+
+    def store(zf, path):
+        # xlsx files are already deflated; storing avoids compressing twice
+        zf.write(path, arcnames[path], compress_type=zipfile.ZIP_STORED)
+        os.remove(path)
+
+    try:
+        with zipfile.ZipFile(output, "w") as zf:
+            if workers == 1:
+                for task in tasks:
+                    store(zf, _build_entry(task, timetable))
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_zip_worker,
+                                         initargs=(timetable,)) as pool:
+                    queue = iter(tasks)
+                    pending = set()
+                    for task in queue:
+                        pending.add(pool.submit(_build_entry, task))
+                        if len(pending) >= workers * 2:
+                            break
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            store(zf, future.result())
+                            task = next(queue, None)
+                            if task is not None:
+                                pending.add(pool.submit(_build_entry, task))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return len(entries)
@@ -0,0 +1,179 @@
+"""Pre-solve capacity check: is there room for every requested period at all?
+
+Everything is counted in periods (the "hours" inputs are periods per week).
+The teacher check is a max-flow over subject demand -> qualified teachers ->
+weekly teacher capacity; when the flow falls short, the min cut names the
+group of subjects and the teachers they compete for. These are necessary
+conditions only: passing them does not guarantee the greedy solver places
+everything, but failing them guarantees it cannot.
+"""
+import collections
+import time
+
+from .calendar import calendar_for
+from .instrument import timed
+from .rooms import LAB
+from .solver import UNASSIGNED_TEACHER
+
+Issue = collections.namedtuple("Issue", ["kind", "scope", "demand", "capacity", "message"])
+
+
+def _max_flow(capacity, source, sink):
+    """Dinic on ``{u: {v: capacity}}``; returns ``(flow, nodes reachable from source in the residual)``."""
+    residual = collections.defaultdict(dict)
+    for u, edges in capacity.items():
+        for v, cap in edges.items():
+            residual[u][v] = residual[u].get(v, 0) + cap
+            residual[v].setdefault(u, 0)
+    flow = 0
+    while True:
+        level = {source: 0}
+        queue = collections.deque([source])
+        while queue:
+            u = queue.popleft()
+            for v, cap in residual[u].items():
+                if cap > 0 and v not in level:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        if sink not in level:
+            return flow, set(level)
+        # Blocking flow along the level graph; each node keeps its next untried arc
+        arcs = {u: list(residual[u]) for u in level}
+        pointer = dict.fromkeys(level, 0)
+        path = [source]
+        while path:
+            u = path[-1]
+            if u == sink:
+                push = min(residual[a][b] for a, b in zip(path, path[1:]))
+                for a, b in zip(path, path[1:]):
+                    residual[a][b] -= push
+                    residual[b][a] += push
+                flow += push
+                path = [source]
+                continue
+            edges = arcs[u]
+            while pointer[u] < len(edges):
+                v = edges[pointer[u]]
+                if residual[u][v] > 0 and level.get(v) == level[u] + 1:
+                    path.append(v)
+                    break
+                pointer[u] += 1
+            else:
+                # Dead end: drop it and move its parent past this arc
+                path.pop()
+                if path:
+                    pointer[path[-1]] += 1
+
+
+def _subject_groups(subject_teachers):
+    """Subjects linked through shared teachers; each group is an independent flow problem."""
+    parent = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for subject, teachers in subject_teachers.items():
+        for teacher in teachers:
+            parent[find(("teacher", teacher))] = find(("subject", subject))
+    groups = collections.defaultdict(list)
+    for subject in subject_teachers:
+        groups[find(("subject", subject))].append(subject)
+    return list(groups.values())
+
+
+@timed("analyze", lambda report: {"issues": len(report["issues"])})
+def analyze(subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms=None, rooms=None,
+            calendar=None, class_shifts=None):
+    """Check requested periods against class, practical-slot, teacher, room and lab capacity.
+
+    Takes the same inputs as :func:`~ttg.solver.generate_institution_timetables`
+    and returns a dict with ``ok``, a list of :data:`Issue` tuples under
+    ``issues``, the weekly teaching ``slots`` per class and ``elapsed`` seconds.
+    With ``rooms`` (the Rooms sheet) practical pairs are also checked against
+    the labs' pair slots. With a compiled ``calendar`` each class is checked
+    against the grid of its shift (``class_shifts``), day by day.
+    """
+    start = time.perf_counter()
+    calendar = calendar or calendar_for(days, periods, breaks)
+    class_shifts = class_shifts or {}
+    slots = calendar.teaching_slots()
+    # A teacher or room can be used in any shift
+    week = sum(bin(calendar.any_open_mask(d)).count("1") for d in range(len(calendar.days)))
+    issues = []
+
+    subject_demand = collections.Counter()
+    lab_pairs = 0
+    room_demand = collections.Counter()
+    room_classes = collections.Counter()
+    for class_key, subject_hours in class_subject_hours.items():
+        shift = class_shifts.get(class_key)
+        class_slots = calendar.teaching_slots(shift)
+        class_pair_slots = calendar.pair_slots(shift)
+        demand = sum(h['TH'] + h['PR'] for h in subject_hours.values())
+        if demand > class_slots:
+            issues.append(Issue("class", class_key, demand, class_slots,
+                                f"{class_key} needs {demand} periods but the week has {class_slots} teaching periods"))
+        pairs = sum(h['PR'] // 2 for h in subject_hours.values())
+        lab_pairs += pairs
+        if pairs > class_pair_slots:
+            issues.append(Issue("practicals", class_key, pairs, class_pair_slots,
+                                f"{class_key} needs {pairs} double periods for practicals but only "
+                                f"{class_pair_slots} fit between breaks in the week"))
+        for subject, h in subject_hours.items():
+            subject_demand[subject] += h['TH'] + h['PR']
+        if class_rooms is not None:
+            room_demand[class_rooms[class_key]] += demand
+            room_classes[class_rooms[class_key]] += 1
+
+    # Subjects without mapped faculty go to the never-booked placeholder teacher. Subjects that share no
+    # teacher cannot compete, so each connected group gets its own (small) flow network.
+    subject_teachers = {}
+    for subject, demand in subject_demand.items():
+        teachers = [t for t in subject_teacher_map.get(subject) or [] if t != UNASSIGNED_TEACHER]
+        if demand and teachers:
+            subject_teachers[subject] = teachers
+    source, sink = ("source",), ("sink",)
+    for group in _subject_groups(subject_teachers):
+        network = {source: {}}
+        for subject in group:
+            network[source][("subject", subject)] = subject_demand[subject]
+            network[("subject", subject)] = {("teacher", t): subject_demand[subject] for t in subject_teachers[subject]}
+            for t in subject_teachers[subject]:
+                network.setdefault(("teacher", t), {sink: week})
+        demand = sum(network[source].values())
+        # Hall's condition: every subject set reaches at least the smallest teacher list, so a group whose
+        # whole demand fits in that many weeks can always be staffed
+        if demand <= min(len(subject_teachers[s]) for s in group) * week:
+            continue
+        flow, reachable = _max_flow(network, source, sink)
+        if flow < demand:
+            # The min cut separates the subjects that cannot be served from the teachers they saturate
+            subjects = sorted(name for kind, *rest in reachable if kind == "subject" for name in rest)
+            teachers = sorted(name for kind, *rest in reachable if kind == "teacher" for name in rest)
+            wanted = sum(subject_demand[s] for s in subjects)
+            capacity = len(teachers) * week
+            verb = "needs" if len(subjects) == 1 else "need"
+            issues.append(Issue("teachers", ", ".join(teachers), wanted, capacity,
+                                f"{', '.join(subjects)} {verb} {wanted} periods but their teachers "
+                                f"({', '.join(teachers)}) can give at most {capacity}; "
+                                f"{demand - flow} period(s) cannot be staffed"))
+
+    # A room used by one class is already covered by that class's own check
+    for room, demand_periods in room_demand.items():
+        if room_classes[room] > 1 and demand_periods > week:
+            issues.append(Issue("room", room, demand_periods, week,
+                                f"Room {room} is shared by {room_classes[room]} classes needing "
+                                f"{demand_periods} periods but has {week} teaching periods"))
+
+    labs = sum(room.kind == LAB for room in rooms or [])
+    lab_slots = labs * sum(calendar.pair_slots(shift) for shift in calendar.shifts)
+    if labs and lab_pairs > lab_slots:
+        issues.append(Issue("labs", "labs", lab_pairs, lab_slots,
+                            f"Practicals need {lab_pairs} double periods but the {labs} lab(s) "
+                            f"have {lab_slots}"))
+
+    return {"ok": not issues, "issues": issues, "slots": slots, "elapsed": time.perf_counter() - start}
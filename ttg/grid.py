@@ -0,0 +1,217 @@
+"""Compact timetable storage: interned ids in days x periods x classes arrays.
+
+Labels such as ``"Maths TH (T1) [Room 101]"`` are only built when a view is
+rendered or exported; the solver works on small integers.
+"""
+import numpy as np
+import pandas as pd
+
+from .calendar import calendar_for
+
+# --- Slot kinds ---
+KIND_EMPTY = 0
+KIND_TH = 1
+KIND_TH_PR = 2  # theory period of a subject that also has practicals
+KIND_PR = 3
+KIND_FIXED = 4    # coaching session pinned at a fixed day/time
+KIND_SESSION = 5  # flexible coaching session (not a subject)
+KIND_LABELS = np.array(["", "TH", "TH (PR)", "(PR)", "(Fixed)", "(Session)"], dtype=object)
+# Kinds that the optimizer and repair never move
+PINNED_KINDS = (KIND_FIXED, KIND_SESSION)
+
+EMPTY = -1
+
+
+class Interner:
+    """Bidirectional name <-> small integer id table."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def get(self, name, default=EMPTY):
+        return self.ids.get(name, default)
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def lookup_array(self):
+        """Object array of names, with ``""`` appended so id -1 indexes to it."""
+        return np.array(self.names + [""], dtype=object)
+
+
+class Timetable:
+    """Institution timetable stored as ``(days, periods, classes)`` id arrays.
+
+    ``subject``, ``teacher`` and ``room`` hold interned ids (``-1`` = empty)
+    and ``kind`` holds one of the ``KIND_*`` codes. Break columns are marked
+    in ``is_break`` and never hold lessons. Which columns are teaching
+    periods on which day comes from ``calendar`` (a
+    :class:`~ttg.calendar.Calendar`, uniform over the days by default) and
+    the shift each class follows in ``class_shifts``.
+    """
+
+    def __init__(self, days, periods, breaks, classes, subjects=None, teachers=None, rooms=None,
+                 calendar=None, class_shifts=None):
+        self.days = list(days)
+        self.periods = list(periods)
+        self.breaks = dict(breaks)
+        self.calendar = calendar or calendar_for(self.days, self.periods, self.breaks)
+        self.class_shifts = dict(class_shifts or {})
+        self.classes = Interner(classes)
+        self.subjects = subjects or Interner()
+        self.teachers = teachers or Interner()
+        self.rooms = rooms or Interner()
+        shape = (len(self.days), len(self.periods), len(self.classes))
+        self.subject = np.full(shape, EMPTY, dtype=np.int32)
+        self.teacher = np.full(shape, EMPTY, dtype=np.int32)
+        self.room = np.full(shape, EMPTY, dtype=np.int32)
+        self.kind = np.zeros(shape, dtype=np.int8)
+        self.is_break = np.array([p in self.breaks for p in self.periods], dtype=bool)
+        # Days x periods: a teaching period for at least one shift
+        self.open = np.array([[self.calendar.any_open_mask(d) >> p & 1 for p in range(len(self.periods))]
+                              for d in range(len(self.days))], dtype=bool).reshape(shape[:2])
+        # class key -> {subject: periods that could not be placed}
+        self.unplaced = {}
+        # Pinned coaching sessions with their exact times, and the ones that could not be pinned
+        self.sessions = []
+        self.conflicts = []
+
+    @property
+    def shape(self):
+        return self.subject.shape
+
+    @property
+    def nbytes(self):
+        return self.subject.nbytes + self.teacher.nbytes + self.room.nbytes + self.kind.nbytes
+
+    def place(self, day, period, cls, subject, teacher, room, kind):
+        self.subject[day, period, cls] = self.subjects.intern(subject)
+        self.teacher[day, period, cls] = self.teachers.intern(teacher)
+        self.room[day, period, cls] = self.rooms.intern(room)
+        self.kind[day, period, cls] = kind
+
+    def clear(self, day, period, cls):
+        self.subject[day, period, cls] = EMPTY
+        self.teacher[day, period, cls] = EMPTY
+        self.room[day, period, cls] = EMPTY
+        self.kind[day, period, cls] = KIND_EMPTY
+
+    # --- Queries ---
+    def class_index(self, class_key):
+        return self.classes.ids[class_key]
+
+    def open_mask(self, day, cls):
+        """Bitmask of the teaching periods of class index ``cls`` on ``day``."""
+        return self.calendar.open_mask(day, self.class_shifts.get(self.classes[cls]))
+
+    def class_teachers(self, class_key):
+        ids = np.unique(self.teacher[:, :, self.class_index(class_key)])
+        return [self.teachers[i] for i in ids if i != EMPTY]
+
+    def teacher_loads(self, teachers=None, ignore=("TBD",)):
+        """``{teacher: periods per week}`` over every class, busiest first (only ``teachers`` when given)."""
+        counts = np.bincount(self.teacher[self.teacher != EMPTY], minlength=len(self.teachers))
+        for name in ignore:
+            if name in self.teachers:
+                counts[self.teachers.get(name)] = 0
+        ids = np.argsort(-counts, kind="stable")
+        if teachers is not None:
+            wanted = np.array([self.teachers.get(t) for t in teachers if t in self.teachers], dtype=np.int64)
+            ids = ids[np.isin(ids, wanted)]
+        return {self.teachers[i]: int(counts[i]) for i in ids.tolist() if counts[i]}
+
+    def teacher_conflicts(self, ignore=("TBD",)):
+        """Return ``(day, period, teacher)`` triples booked in more than one class."""
+        n_teachers = max(len(self.teachers), 1)
+        d, p, c = np.nonzero(self.teacher != EMPTY)
+        t = self.teacher[d, p, c]
+        keys = (d * len(self.periods) + p) * n_teachers + t
+        uniq, counts = np.unique(keys, return_counts=True)
+        clashes = []
+        for key in uniq[counts > 1]:
+            slot, tid = divmod(int(key), n_teachers)
+            if self.teachers[tid] in ignore:
+                continue
+            day, period = divmod(slot, len(self.periods))
+            clashes.append((self.days[day], self.periods[period], self.teachers[tid]))
+        return clashes
+
+    # --- Rendering (labels are only built here) ---
+    def break_cells(self, class_key):
+        """Days x periods boolean array of the break cells of one class (they differ by day and shift)."""
+        shift = self.class_shifts.get(class_key)
+        masks = np.array([self.calendar.break_mask(d, shift) for d in range(len(self.days))], dtype=object)
+        bits = np.array([1 << p for p in range(len(self.periods))], dtype=object)
+        return (masks[:, None] & bits[None, :]) != 0
+
+    def class_frame(self, class_key):
+        """Days x periods DataFrame of display labels for one class."""
+        c = self.class_index(class_key)
+        subjects = self.subjects.lookup_array()[self.subject[:, :, c]]
+        teachers = self.teachers.lookup_array()[self.teacher[:, :, c]]
+        rooms = self.rooms.lookup_array()[self.room[:, :, c]]
+        kinds = KIND_LABELS[self.kind[:, :, c]]
+        labels = subjects + " " + kinds + " (" + teachers + ") [" + rooms + "]"
+        labels = np.where(self.kind[:, :, c] == KIND_PR, subjects + " (PR) (" + teachers + ") [" + rooms + "]", labels)
+        labels = np.where(self.subject[:, :, c] == EMPTY, "", labels)
+        d, p = np.nonzero(self.break_cells(class_key))
+        labels[d, p] = [self.breaks[self.periods[i]] for i in p.tolist()]
+        return pd.DataFrame(labels, index=self.days, columns=self.periods)
+
+    def teacher_schedules(self, teachers=None):
+        """``{teacher: {day: {period: label}}}`` for the given (default: all) teachers."""
+        wanted = None
+        if teachers is not None:
+            wanted = np.array([self.teachers.get(t) for t in teachers if t in self.teachers], dtype=np.int32)
+        d, p, c = np.nonzero(self.teacher != EMPTY)
+        t = self.teacher[d, p, c]
+        if wanted is not None:
+            keep = np.isin(t, wanted)
+            d, p, c, t = d[keep], p[keep], c[keep], t[keep]
+        order = np.lexsort((p, d, t))
+        schedules = {}
+        for i in order:
+            teacher = self.teachers[t[i]]
+            if teacher not in schedules:
+                schedules[teacher] = {day: {} for day in self.days}
+            day, period, cls = d[i], p[i], c[i]
+            schedules[teacher][self.days[day]][self.periods[period]] = self._teacher_label(day, period, cls)
+        return schedules
+
+    def teacher_frame(self, teacher):
+        """Days x periods DataFrame for one teacher, only the periods they teach, in period order.
+
+        Built straight from the id arrays.
+        """
+        labels = np.full(self.shape[:2], "", dtype=object)
+        tid = self.teachers.get(teacher)
+        if tid != EMPTY:
+            d, p, c = np.nonzero(self.teacher == tid)
+            subjects = self.subjects.lookup_array()[self.subject[d, p, c]]
+            rooms = self.rooms.lookup_array()[self.room[d, p, c]]
+            labels[d, p] = (subjects + " " + KIND_LABELS[self.kind[d, p, c]] + " " + self.classes.lookup_array()[c]
+                            + " [" + rooms + "]")
+        used = (labels != "").any(axis=0)
+        return pd.DataFrame(labels[:, used], index=self.days, columns=np.array(self.periods, dtype=object)[used])
+
+    def _teacher_label(self, day, period, cls):
+        kind = self.kind[day, period, cls]
+        subject = self.subjects[self.subject[day, period, cls]]
+        room = self.rooms[self.room[day, period, cls]]
+        return f"{subject} {KIND_LABELS[kind]} {self.classes[cls]} [{room}]"
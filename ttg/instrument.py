@@ -0,0 +1,244 @@
+"""Phase timings, allocations and counts for one run, as JSON logs or a profile.
+
+The app and the CLI create one :class:`StageTimer` per run and
+:meth:`~StageTimer.install` it; engine code marks its own phases with
+:func:`phase` or :func:`timed` (workbook parsing, the solve, optimisation,
+export, ...) and they are recorded into the installed timer. Every finished
+phase is also logged as one JSON object on the ``ttg.phases`` logger (see
+:func:`log_json`). Allocations are only measured while :mod:`tracemalloc`
+is tracing, e.g. inside :func:`profile_run`, which also dumps a cProfile of
+the run.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+
+LOG = logging.getLogger("ttg.phases")
+
+# Timer that engine phases record into, per thread / context
+_installed = contextvars.ContextVar("ttg_stage_timer", default=None)
+
+
+class Phase:
+    """One phase: calls, wall seconds, peak traced bytes above its start and counts."""
+
+    __slots__ = ("name", "calls", "seconds", "peak_bytes", "counts")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_bytes = None
+        self.counts = {}
+
+    def count(self, **counts):
+        """Record counts such as ``placed=120``; numbers add up over calls, other values are replaced."""
+        for key, value in counts.items():
+            numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if numeric and isinstance(self.counts.get(key), (int, float)):
+                self.counts[key] += value
+            else:
+                self.counts[key] = value
+
+    def as_dict(self):
+        return {
+            "phase": self.name,
+            "calls": self.calls,
+            "ms": round(self.seconds * 1000, 2),
+            "peak_kb": None if self.peak_bytes is None else round(self.peak_bytes / 1024, 1),
+            **self.counts,
+        }
+
+
+class StageTimer:
+    """Ordered totals per phase name for one run; a phase entered twice accumulates."""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.phases = {}
+        self._start = time.perf_counter()
+        # Highest traced memory seen so far by each open phase, innermost last
+        self._peaks = []
+
+    def install(self):
+        """Record the engine's phases in the current thread (or context) into this timer from now on."""
+        _installed.set(self)
+        return self
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the block as phase ``name``; yields the :class:`Phase` of this call for counts."""
+        call = Phase(name)
+        # Listed when entered, so an enclosing stage comes before the phases inside it
+        self.phases.setdefault(name, Phase(name))
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(current)
+        start = time.perf_counter()
+        try:
+            yield call
+        finally:
+            call.calls = 1
+            call.seconds = time.perf_counter() - start
+            if tracing:
+                peak = self._peaks.pop()
+                if tracemalloc.is_tracing():
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    call.peak_bytes = peak - current
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self._record(call)
+
+    def _record(self, call):
+        total = self.phases[call.name]
+        total.calls += 1
+        total.seconds += call.seconds
+        if call.peak_bytes is not None:
+            total.peak_bytes = max(total.peak_bytes or 0, call.peak_bytes)
+        total.count(**call.counts)
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info(json.dumps({"ts": round(time.time(), 3), "run": self.run_id, **call.as_dict()}, default=str))
+
+    @property
+    def timings(self):
+        """``{phase: seconds}``."""
+        return {name: total.seconds for name, total in self.phases.items()}
+
+    @property
+    def elapsed(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self._start
+
+    def rows(self):
+        """``[{"phase", "calls", "ms", "peak_kb", counts...}]`` in the order the phases were first entered."""
+        return [total.as_dict() for total in self.phases.values()]
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Mark an engine phase; a no-op apart from the yielded :class:`Phase` when nothing records it."""
+    timer = _installed.get()
+    if timer is None and not LOG.isEnabledFor(logging.INFO):
+        yield Phase(name)
+        return
+    with (timer or StageTimer(run_id="-")).stage(name) as call:
+        yield call
+
+
+def timed(name, counts=None):
+    """Decorator running the function as :func:`phase` ``name``; ``counts(result)`` returns its counts."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name) as call:
+                result = function(*args, **kwargs)
+                if counts is not None:
+                    call.count(**counts(result))
+            return result
+        return wrapper
+    return decorate
+
+
+def log_json(path=None):
+    """Write ``ttg.phases`` records, one JSON object per line, to ``path`` (``None`` or ``"-"``: stderr)."""
+    handler = logging.FileHandler(path, encoding="utf-8") if path and path != "-" else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    LOG.addHandler(handler)
+    LOG.setLevel(logging.INFO)
+    return handler
+
+
+@contextlib.contextmanager
+def profile_run(directory, name="ttg"):
+    """cProfile and tracemalloc the block, then write the results to ``directory``.
+
+    Writes ``<name>.prof`` (open with ``python -m pstats`` or snakeviz),
+    ``<name>-alloc.txt`` (the 50 lines that allocated the most) and, when a
+    timer is installed, ``<name>-phases.json``. Only the calling thread is
+    profiled; candidate and ZIP worker processes are not. Yields a dict that
+    holds the written paths once the block exits.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield paths
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        base = os.path.join(directory, name)
+        paths["profile"] = base + ".prof"
+        profiler.dump_stats(paths["profile"])
+        paths["allocations"] = base + "-alloc.txt"
+        with open(paths["allocations"], "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+        timer = _installed.get()
+        if timer is not None:
+            paths["phases"] = base + "-phases.json"
+            with open(paths["phases"], "w", encoding="utf-8") as f:
+                json.dump({"run": timer.run_id, "phases": timer.rows()}, f, indent=2, default=str)
+
+
+class TracingHolds:
+    """Shared switch for the process-wide :mod:`tracemalloc`: it traces while anyone holds it.
+
+    Holders (e.g. app sessions that asked for allocation figures) :meth:`hold`
+    and :meth:`release` it; a hold given a ``ttl`` lapses unless renewed, so a
+    holder that disappears cannot keep the whole process tracing. Tracing that
+    was already on when the first hold came is never stopped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # holder -> monotonic expiry, or None to hold until released
+        self._holds = {}
+        self._started = False
+
+    def hold(self, holder, ttl=None):
+        with self._lock:
+            self._holds[holder] = None if ttl is None else time.monotonic() + ttl
+            self._apply()
+
+    def release(self, holder):
+        with self._lock:
+            self._holds.pop(holder, None)
+            self._apply()
+
+    @contextlib.contextmanager
+    def holding(self, holder):
+        """Hold tracing for the block."""
+        self.hold(holder)
+        try:
+            yield
+        finally:
+            self.release(holder)
+
+    def _apply(self):
+        now = time.monotonic()
+        self._holds = {h: expiry for h, expiry in self._holds.items() if expiry is None or expiry > now}
+        if self._holds and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        elif not self._holds and self._started:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._started = False
@@ -0,0 +1,255 @@
+import collections
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import threading
+
+import pandas as pd
+
+from .instrument import phase
+from .rooms import rooms_from_frame
+
+# --- Institution types ---
+# The engine uses plain keys; the Streamlit app shows the emoji labels.
+SCHOOL = "school"
+COACHING = "coaching"
+COLLEGE = "college"
+
+INSTITUTION_LABELS = {
+    "📚School": SCHOOL,
+    "🧪Coaching Institute": COACHING,
+    "🏛️College": COLLEGE,
+}
+INSTITUTION_TYPES = (SCHOOL, COACHING, COLLEGE)
+
+# Section choices offered for each institution type
+DEFAULT_SECTIONS = {
+    SCHOOL: ["A", "B", "C"],
+    COACHING: ["A", "B"],
+    COLLEGE: ["A", "B", "C"],
+}
+
+
+def normalize_institution_type(institution_type):
+    """Accept either an engine key or a UI label and return the engine key."""
+    key = INSTITUTION_LABELS.get(institution_type, institution_type)
+    if key not in INSTITUTION_TYPES:
+        raise ValueError("Invalid institution type")
+    return key
+
+
+def normalize_class_name(class_name):
+    """Class names in the Classes sheet may carry a "Std." prefix the allocation sheet drops."""
+    return str(class_name).replace("Std.", "").strip()
+
+
+# Bump when the parsed layout changes so stale snapshots are ignored
+SNAPSHOT_VERSION = 2
+# Sheets each institution type needs; every sheet is parsed at most once per workbook
+SHEETS = {
+    SCHOOL: ["TeacherMapping", "CLASS-SUBJECT ALLOCATION", "Classes"],
+    COACHING: ["FACULTY-SUBJECT", "SUBJECTS_COACHING"],
+    COLLEGE: ["SUBJECTS_COLLEGE", "SUBJECT-ALLOCATION"],
+}
+# Read when present, for any institution type
+ROOMS_SHEET = "Rooms"
+# Parsed workbooks kept in memory, keyed by (content hash, institution type)
+MEMORY_CACHE_SIZE = 16
+
+WorkbookData = collections.namedtuple(
+    "WorkbookData",
+    ["subject_teacher_map", "df_subject_hours", "df_classes", "stream_subject_map", "subject_faculty_map", "rooms",
+     "digest"],
+)
+
+_memory_cache = collections.OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def snapshot_dir():
+    """Directory for compiled workbook snapshots (``$TTG_CACHE_DIR`` or ``~/.cache/ttg``).
+
+    Snapshots are pickles, so they are only written to and read from a
+    directory owned by the current user that no one else can write to.
+    """
+    return os.environ.get("TTG_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "ttg")
+
+
+def clear_memory_cache():
+    """Forget the parsed workbooks kept in memory; snapshots on disk are kept."""
+    with _memory_lock:
+        _memory_cache.clear()
+
+
+def read_source_bytes(source):
+    """Raw workbook bytes from a path, ``bytes`` or a file-like object (e.g. a Streamlit upload)."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def workbook_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _split_lists(df, key, column):
+    """``{key: [stripped, non-empty items of the comma separated column]}`` without iterrows.
+
+    A key that appears on several rows keeps its last row, like a dict built row by row.
+    """
+    df = df.drop_duplicates(subset=key, keep="last")
+    items = df[column].astype(str).str.split(",").explode().str.strip()
+    items = items[items != ""]
+    grouped = items.groupby(df[key].loc[items.index], sort=False).agg(list)
+    mapping = {k: [] for k in df[key]}
+    mapping.update(grouped.to_dict())
+    return mapping
+
+
+def expand_class_subject_allocation(df):
+    classes = df['Class'].astype(str).str.split(',').explode().str.strip()
+    return pd.DataFrame({'Class': classes.values, 'Subject': df['Subject'].loc[classes.index].values})
+
+
+def _parse_workbook(data, institution_type):
+    excel = pd.ExcelFile(io.BytesIO(data))
+    wanted = SHEETS[institution_type] + ([ROOMS_SHEET] if ROOMS_SHEET in excel.sheet_names else [])
+    sheets = pd.read_excel(excel, sheet_name=wanted)
+    for df in sheets.values():
+        df.columns = df.columns.astype(str).str.strip()  # Clean headers
+    stream_subject_map = {}
+    subject_faculty_map = {}
+
+    if institution_type == SCHOOL:
+        df_mapping = sheets["TeacherMapping"]
+        df_subject_hours = expand_class_subject_allocation(sheets["CLASS-SUBJECT ALLOCATION"])
+        df_classes = sheets["Classes"]
+
+    elif institution_type == COACHING:
+        df_mapping = sheets["FACULTY-SUBJECT"]
+        df_mapping['Teachers'] = df_mapping['Faculty']
+        df_subjects_coaching = sheets["SUBJECTS_COACHING"].rename(columns={'Stream': 'Class'})
+        df_subject_hours = expand_class_subject_allocation(df_subjects_coaching)
+        df_classes = pd.DataFrame({'Class': df_subject_hours['Class'].unique()})
+        # Built from the expanded rows so "IIT-JEE-11, NEET-11" lists the subject under both streams
+        stream_subject_map = df_subject_hours.groupby('Class', sort=False)['Subject'].agg(list).to_dict()
+
+    else:
+        df_mapping = sheets["SUBJECTS_COLLEGE"]
+        df_mapping['Teachers'] = df_mapping['Faculty']  # unify naming
+        df_subject_hours_raw = sheets["SUBJECT-ALLOCATION"]
+        df_subject_hours_raw.columns = ["Class", "Subject"]
+        df_subject_hours = expand_class_subject_allocation(df_subject_hours_raw)
+        df_classes = pd.DataFrame({'Class': df_subject_hours['Class'].unique()})
+
+    # Unified mapping logic
+    subject_teacher_map = _split_lists(df_mapping, 'Subject', 'Teachers')
+    if institution_type == COACHING:
+        subject_faculty_map = subject_teacher_map
+
+    df_subject_hours['Class'] = df_subject_hours['Class'].astype(str).str.strip()
+    rooms = rooms_from_frame(sheets.get(ROOMS_SHEET))
+    return subject_teacher_map, df_subject_hours, df_classes, stream_subject_map, subject_faculty_map, rooms
+
+
+def _snapshot_path(directory, digest, institution_type):
+    return os.path.join(directory, f"{digest}-{institution_type}-v{SNAPSHOT_VERSION}.pkl")
+
+
+def _private(path):
+    """True when ``path`` is ours and nobody else can write to it (no ownership to check on Windows)."""
+    if not hasattr(os, "getuid"):
+        return True
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return info.st_uid == os.getuid() and not info.st_mode & 0o022
+
+
+def _read_snapshot(path):
+    # Unpickling runs code, so only snapshots nobody else could have planted are loaded
+    if not (_private(os.path.dirname(path)) and _private(path)):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+
+
+def _write_snapshot(path, parsed):
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not _private(directory):
+            return  # a shared directory is never read back, so skip the write
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # a read-only cache directory only costs speed
+
+
+def load_workbook(source, institution_type, use_snapshot=True):
+    """Parse a workbook once and return a :data:`WorkbookData`.
+
+    Results are keyed by the SHA-256 of the workbook bytes: repeat calls with
+    the same content are served from memory, and (with ``use_snapshot``) a
+    pickled snapshot in :func:`snapshot_dir` lets new processes skip openpyxl
+    entirely.
+    """
+    institution_type = normalize_institution_type(institution_type)
+    data = read_source_bytes(source)
+    digest = workbook_digest(data)
+    key = (digest, institution_type)
+
+    with _memory_lock:
+        parsed = _memory_cache.get(key)
+        if parsed is not None:
+            _memory_cache.move_to_end(key)
+    if parsed is None:
+        with phase("load workbook") as call:
+            path = _snapshot_path(snapshot_dir(), digest, institution_type)
+            parsed = _read_snapshot(path) if use_snapshot else None
+            call.count(source="snapshot", bytes=len(data))
+            if parsed is None:
+                parsed = _parse_workbook(data, institution_type)
+                call.count(source="parsed", rows=len(parsed[1]))
+                if use_snapshot:
+                    _write_snapshot(path, parsed)
+        with _memory_lock:
+            _memory_cache[key] = parsed
+            while len(_memory_cache) > MEMORY_CACHE_SIZE:
+                _memory_cache.popitem(last=False)
+
+    subject_teacher_map, df_subject_hours, df_classes, stream_subject_map, subject_faculty_map, rooms = parsed
+    # Callers get their own frames and maps so edits never leak into the cache; Room entries are immutable.
+    # The maps are {name: [str]}, so copying each list is a full copy (and far cheaper than deepcopy).
+    teachers = {key: list(values) for key, values in subject_teacher_map.items()}
+    faculty = teachers if subject_faculty_map is subject_teacher_map else \
+        {key: list(values) for key, values in subject_faculty_map.items()}
+    return WorkbookData(teachers, df_subject_hours.copy(), df_classes.copy(),
+                        {key: list(values) for key, values in stream_subject_map.items()}, faculty,
+                        list(rooms), digest)
+
+
+# --- Load teacher-subject mapping from Excel ---
+def load_excel_data(file_path, institution_type):
+    workbook = load_workbook(file_path, institution_type)
+    return workbook.subject_teacher_map, workbook.df_subject_hours, workbook.df_classes
+
+
+def class_subjects(df_subject_hours, class_name):
+    """Subjects allocated to one class, in workbook order."""
+    df_filtered_subjects = df_subject_hours[df_subject_hours['Class'] == normalize_class_name(class_name)]
+    return df_filtered_subjects['Subject'].unique().tolist()
@@ -0,0 +1,243 @@
+"""Simulated-annealing improvement of a solved :class:`~ttg.grid.Timetable`.
+
+The move is a swap of two teaching slots inside one class (either slot may
+be empty, so this also covers "move a lesson to a free slot"). Practical
+pairs and pinned coaching sessions stay where they were placed. Each move is
+checked against per-teacher and per-room day bitmasks and scored with an O(1)
+delta on the same penalties as :mod:`ttg.quality`, so the final ``evaluate``
+score equals the starting score plus the sum of accepted deltas.
+"""
+import math
+import random
+import time
+
+import numpy as np
+
+from .grid import EMPTY, KIND_PR, PINNED_KINDS
+from .instrument import timed
+from .quality import DEFAULT_WEIGHTS
+from .solver import UNASSIGNED_TEACHER
+
+_CHECK_EVERY = 1024  # moves between clock reads / temperature updates
+
+
+def _popcount(x):
+    return bin(x).count("1")
+
+
+class _State:
+    """Flat Python-list mirror of the timetable plus the indexes the deltas need."""
+
+    def __init__(self, timetable, weights):
+        self.tt = timetable
+        self.n_days, self.n_periods, self.n_classes = timetable.shape
+        D, P = self.n_days, self.n_periods
+        self.subject = timetable.subject.transpose(2, 0, 1).ravel().tolist()
+        self.teacher = timetable.teacher.transpose(2, 0, 1).ravel().tolist()
+        self.room = timetable.room.transpose(2, 0, 1).ravel().tolist()
+        self.kind = timetable.kind.transpose(2, 0, 1).ravel().tolist()
+        self.tbd = timetable.teachers.get(UNASSIGNED_TEACHER)
+        self.w_repeat = weights["subject_repeats"]
+        self.w_gap = weights["teacher_gaps"]
+        self.w_load = weights["load_imbalance"]
+
+        # Per day, the periods that are not teaching time for any class (breaks, or outside that day's grid)
+        self.closed_mask = [((1 << P) - 1) & ~timetable.calendar.any_open_mask(d) for d in range(D)]
+        self.n_subjects = max(len(timetable.subjects), 1)
+        self.teacher_mask = [[0] * D for _ in range(max(len(timetable.teachers), 1))]
+        self.room_mask = [[0] * D for _ in range(max(len(timetable.rooms), 1))]
+        self.count = [0] * (self.n_classes * D * self.n_subjects)
+        self.load = [0] * (self.n_classes * D)
+        # Load indexes of the days each class has teaching periods on; only those count for imbalance
+        self.open_loads = [[c * D + d for d in range(D) if timetable.open_mask(d, c)] for c in range(self.n_classes)]
+        # Movable slots per class: teaching periods not holding a practical block or pinned session
+        self.movable = [[] for _ in range(self.n_classes)]
+
+        for c in range(self.n_classes):
+            for d in range(D):
+                teaching = timetable.open_mask(d, c)
+                for p in range(P):
+                    if not teaching >> p & 1:
+                        continue
+                    i = (c * D + d) * P + p
+                    s = self.subject[i]
+                    if self.kind[i] != KIND_PR and self.kind[i] not in PINNED_KINDS:
+                        self.movable[c].append((d, p))
+                    if s == EMPTY:
+                        continue
+                    self.load[c * D + d] += 1
+                    if not self._second_pr_half(i, p):
+                        self.count[(c * D + d) * self.n_subjects + s] += 1
+                    if self.teacher[i] != self.tbd:
+                        self.teacher_mask[self.teacher[i]][d] |= 1 << p
+                    self.room_mask[self.room[i]][d] |= 1 << p
+
+    def _second_pr_half(self, i, p):
+        return (self.kind[i] == KIND_PR and p > 0 and self.kind[i - 1] == KIND_PR
+                and self.subject[i - 1] == self.subject[i])
+
+    # --- Penalty pieces, each O(1) (load is O(days)) ---
+    def gap(self, t, d):
+        if t == EMPTY or t == self.tbd:
+            return 0
+        mask = self.teacher_mask[t][d]
+        if not mask:
+            return 0
+        lo = (mask & -mask).bit_length() - 1
+        hi = mask.bit_length()
+        span = ((1 << hi) - 1) ^ ((1 << lo) - 1)
+        return (hi - lo) - _popcount(mask) - _popcount(span & self.closed_mask[d])
+
+    def repeat(self, c, d, s):
+        if s == EMPTY:
+            return 0
+        n = self.count[(c * self.n_days + d) * self.n_subjects + s]
+        return n - 1 if n > 1 else 0
+
+    def imbalance(self, c):
+        loads = [self.load[i] for i in self.open_loads[c]]
+        return max(loads) - min(loads) if loads else 0
+
+    def local_penalty(self, c, d1, d2, subjects, teachers):
+        days = (d1,) if d1 == d2 else (d1, d2)
+        total = self.w_load * self.imbalance(c)
+        for d in days:
+            for s in subjects:
+                total += self.w_repeat * self.repeat(c, d, s)
+            for t in teachers:
+                total += self.w_gap * self.gap(t, d)
+        return total
+
+    # --- Mutation ---
+    def _lift(self, i, c, d, p):
+        s, t, r = self.subject[i], self.teacher[i], self.room[i]
+        if s == EMPTY:
+            return
+        self.load[c * self.n_days + d] -= 1
+        self.count[(c * self.n_days + d) * self.n_subjects + s] -= 1
+        if t != self.tbd:
+            self.teacher_mask[t][d] &= ~(1 << p)
+        self.room_mask[r][d] &= ~(1 << p)
+
+    def _drop(self, i, c, d, p):
+        s, t, r = self.subject[i], self.teacher[i], self.room[i]
+        if s == EMPTY:
+            return
+        self.load[c * self.n_days + d] += 1
+        self.count[(c * self.n_days + d) * self.n_subjects + s] += 1
+        if t != self.tbd:
+            self.teacher_mask[t][d] |= 1 << p
+        self.room_mask[r][d] |= 1 << p
+
+    def swap(self, c, d1, p1, d2, p2):
+        P = self.n_periods
+        i = (c * self.n_days + d1) * P + p1
+        j = (c * self.n_days + d2) * P + p2
+        self._lift(i, c, d1, p1)
+        self._lift(j, c, d2, p2)
+        for arr in (self.subject, self.teacher, self.room, self.kind):
+            arr[i], arr[j] = arr[j], arr[i]
+        self._drop(i, c, d1, p1)
+        self._drop(j, c, d2, p2)
+
+    def feasible(self, c, d1, p1, d2, p2):
+        """Can the lessons at the two slots trade places without double-booking?"""
+        P = self.n_periods
+        i = (c * self.n_days + d1) * P + p1
+        j = (c * self.n_days + d2) * P + p2
+        for src, dst_d, dst_p, other in ((i, d2, p2, j), (j, d1, p1, i)):
+            if self.subject[src] == EMPTY:
+                continue
+            t, r = self.teacher[src], self.room[src]
+            bit = 1 << dst_p
+            if t != self.tbd and t != self.teacher[other] and self.teacher_mask[t][dst_d] & bit:
+                return False
+            if r != self.room[other] and self.room_mask[r][dst_d] & bit:
+                return False
+        return True
+
+    def write_back(self):
+        shape = (self.n_classes, self.n_days, self.n_periods)
+        for name, values in (("subject", self.subject), ("teacher", self.teacher),
+                             ("room", self.room), ("kind", self.kind)):
+            arr = getattr(self.tt, name)
+            arr[...] = np.asarray(values, dtype=arr.dtype).reshape(shape).transpose(1, 2, 0)
+
+
+@timed("optimize", lambda stats: {"moves": stats["moves"], "accepted": stats["accepted"]})
+def optimize(timetable, weights=None, time_limit=2.0, max_moves=None, rng=None,
+             initial_temperature=None, final_temperature=0.05):
+    """Improve ``timetable`` in place by simulated annealing over slot swaps.
+
+    Runs until ``time_limit`` seconds or ``max_moves`` moves, whichever comes
+    first (pass ``time_limit=None`` with ``max_moves`` for a run that is
+    reproducible from the rng seed). Returns a stats dict with the number of
+    ``moves``/``accepted`` moves, the ``initial`` and ``final`` penalty of the
+    optimised terms, and ``elapsed`` seconds.
+    """
+    if time_limit is None and max_moves is None:
+        raise ValueError("optimize needs a time_limit or max_moves budget")
+    rng = rng or random.Random()
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    state = _State(timetable, weights)
+    classes = [c for c in range(state.n_classes) if len(state.movable[c]) > 1]
+    start = time.perf_counter()
+
+    current = sum(state.w_load * state.imbalance(c) for c in range(state.n_classes))
+    current += state.w_repeat * sum(n - 1 for n in state.count if n > 1)
+    current += sum(state.w_gap * state.gap(t, d) for t in range(len(state.teacher_mask)) for d in range(state.n_days))
+    initial = best = current
+    best_snapshot = None
+
+    t0 = initial_temperature or max(state.w_repeat, state.w_gap, state.w_load)
+    temperature = t0
+    moves = accepted = 0
+    P = state.n_periods
+
+    while classes:
+        if moves % _CHECK_EVERY == 0:
+            elapsed = time.perf_counter() - start
+            progress = max(moves / max_moves if max_moves else 0.0,
+                           elapsed / time_limit if time_limit else 0.0)
+            if progress >= 1.0:
+                break
+            temperature = t0 * (final_temperature / t0) ** progress
+            if current < best:
+                best = current
+                best_snapshot = (list(state.subject), list(state.teacher), list(state.room), list(state.kind))
+        moves += 1
+
+        c = rng.choice(classes)
+        slots = state.movable[c]
+        d1, p1 = rng.choice(slots)
+        d2, p2 = rng.choice(slots)
+        i = (c * state.n_days + d1) * P + p1
+        j = (c * state.n_days + d2) * P + p2
+        if i == j or (state.subject[i] == state.subject[j] and state.teacher[i] == state.teacher[j]):
+            continue
+        if not state.feasible(c, d1, p1, d2, p2):
+            continue
+
+        subjects = {state.subject[i], state.subject[j]}
+        teachers = {state.teacher[i], state.teacher[j]}
+        before = state.local_penalty(c, d1, d2, subjects, teachers)
+        state.swap(c, d1, p1, d2, p2)
+        delta = state.local_penalty(c, d1, d2, subjects, teachers) - before
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            current += delta
+            accepted += 1
+        else:
+            state.swap(c, d1, p1, d2, p2)
+
+    if best_snapshot is not None and best < current:
+        state.subject, state.teacher, state.room, state.kind = best_snapshot
+        current = best
+    state.write_back()
+    return {
+        "moves": moves,
+        "accepted": accepted,
+        "initial": initial,
+        "final": current,
+        "elapsed": time.perf_counter() - start,
+    }
@@ -0,0 +1,29 @@
+from .calendar import compile_calendar, plan_from_breaks
+
+DAYS_OPTIONS = {
+    "Mon–Fri": ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+    "Mon–Sat": ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+}
+
+
+def build_breaks(short_break_time, short_break_duration, lunch_break_time, lunch_break_duration):
+    """Map break start times ("HH:MM") to the labels shown in the timetable."""
+    return {
+        short_break_time: f"Short Break ({short_break_duration} min)",
+        lunch_break_time: f"Lunch Break ({lunch_break_duration} min)"
+    }
+
+
+# --- Generate actual period times including breaks inline ---
+def generate_period_times(start_time_str, end_time_str, duration, breaks):
+    """Column labels of one day: ``"HH:MM - HH:MM"`` periods with ``"HH:MM"`` breaks inline.
+
+    Breaks start at their own time and last the minutes in their label; see
+    :func:`~ttg.calendar.day_slots`, which caches the layout per configuration.
+    """
+    plan = plan_from_breaks(start_time_str, end_time_str, duration, breaks)
+    return compile_calendar(["*"], plan).periods
+
+
+def count_teaching_periods(periods, breaks):
+    return len([p for p in periods if p not in breaks])
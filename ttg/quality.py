@@ -0,0 +1,102 @@
+"""Timetable quality metrics, computed on the id arrays of a :class:`~ttg.grid.Timetable`.
+
+Every metric is a penalty (lower is better); ``score`` is their weighted sum.
+"""
+import numpy as np
+
+from .grid import EMPTY, KIND_PR
+from .solver import UNASSIGNED_TEACHER
+
+DEFAULT_WEIGHTS = {
+    "unplaced": 100.0,        # periods the solver could not place
+    "subject_repeats": 3.0,   # extra lessons of one subject on the same day (a PR pair counts once)
+    "teacher_gaps": 1.0,      # idle periods between a teacher's first and last lesson of a day
+    "load_imbalance": 2.0,    # per class, busiest day minus lightest day it has teaching periods on
+}
+
+
+def _teaching(timetable):
+    """Views of the arrays restricted to teaching (non-break) periods."""
+    cols = ~timetable.is_break
+    return timetable.subject[:, cols, :], timetable.teacher[:, cols, :], timetable.kind[:, cols, :]
+
+
+def unplaced_periods(timetable):
+    return sum(sum(missing.values()) for missing in timetable.unplaced.values())
+
+
+def subject_repeats(timetable):
+    subject, _, kind = _teaching(timetable)
+    n_days = subject.shape[0]
+    # A practical pair occupies two periods but is one lesson: count its first half only.
+    prev_subject = np.full_like(subject, EMPTY)
+    prev_subject[:, 1:, :] = subject[:, :-1, :]
+    prev_kind = np.zeros_like(kind)
+    prev_kind[:, 1:, :] = kind[:, :-1, :]
+    second_half = (kind == KIND_PR) & (prev_kind == KIND_PR) & (prev_subject == subject)
+    counted = (subject != EMPTY) & ~second_half
+    d, p, c = np.nonzero(counted)
+    s = subject[d, p, c]
+    n_subjects = int(subject.max()) + 1 if subject.size else 1
+    keys = (c * n_days + d) * n_subjects + s
+    _, counts = np.unique(keys, return_counts=True)
+    return int(np.maximum(counts - 1, 0).sum())
+
+
+def teacher_gaps(timetable):
+    _, teacher, _ = _teaching(timetable)
+    n_days, n_periods, _ = teacher.shape
+    # The "TBD" placeholder is shared by unrelated classes and has no real day to optimise.
+    d, p, c = np.nonzero((teacher != EMPTY) & (teacher != timetable.teachers.get(UNASSIGNED_TEACHER)))
+    if not len(d):
+        return 0
+    t = teacher[d, p, c]
+    busy = np.zeros((len(timetable.teachers), n_days, n_periods), dtype=bool)
+    busy[t, d, p] = True
+    idx = np.arange(n_periods)
+    any_busy = busy.any(axis=2)
+    first = np.where(busy, idx, n_periods).min(axis=2)
+    last = np.where(busy, idx, -1).max(axis=2)
+    span = np.where(any_busy, last - first + 1, 0)
+    # Periods inside the span that are not teaching time that day (e.g. another shift's) are not gaps
+    closed = np.zeros((n_days, n_periods + 1), dtype=np.int64)
+    closed[:, 1:] = np.cumsum(~timetable.open[:, ~timetable.is_break], axis=1)
+    day = np.arange(n_days)[None, :]
+    closed_in_span = np.where(any_busy, closed[day, last + 1] - closed[day, np.minimum(first, n_periods)], 0)
+    return int((span - busy.sum(axis=2) - closed_in_span).sum())
+
+
+def open_days(timetable):
+    """Days x classes: True where the class has at least one teaching period that day in the calendar."""
+    tt = timetable
+    shifts = [tt.class_shifts.get(name) for name in tt.classes.names]
+    by_shift = {shift: [tt.calendar.open_mask(d, shift) != 0 for d in range(len(tt.days))] for shift in set(shifts)}
+    return np.array([by_shift[shift] for shift in shifts], dtype=bool).reshape(len(shifts), len(tt.days)).T
+
+
+def load_imbalance(timetable):
+    subject, _, _ = _teaching(timetable)
+    daily = (subject != EMPTY).sum(axis=1)  # days x classes
+    if not daily.size:
+        return 0
+    # A day off (a short week, another shift's day) is not a light day
+    is_open = open_days(timetable)
+    busiest = np.where(is_open, daily, 0).max(axis=0)
+    lightest = np.where(is_open, daily, np.iinfo(daily.dtype).max).min(axis=0)
+    return int(np.where(is_open.any(axis=0), busiest - lightest, 0).sum())
+
+
+METRICS = {
+    "unplaced": unplaced_periods,
+    "subject_repeats": subject_repeats,
+    "teacher_gaps": teacher_gaps,
+    "load_imbalance": load_imbalance,
+}
+
+
+def evaluate(timetable, weights=None):
+    """Return every metric plus the weighted ``score``."""
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    metrics = {name: fn(timetable) for name, fn in METRICS.items()}
+    metrics["score"] = float(sum(weights[name] * value for name, value in metrics.items()))
+    return metrics
@@ -0,0 +1,266 @@
+"""Incremental repair of a solved timetable after subject hours or teachers change.
+
+Only cells that disagree with the new inputs are touched: surplus lessons are
+lifted, lessons whose teacher is no longer mapped to the subject get another
+free qualified teacher in the same slot (or are lifted when none is free), and
+missing lessons are dropped into free slots. Every other cell stays where it
+was, so a reviewed layout survives a one-number edit.
+"""
+import random
+import time
+
+import numpy as np
+
+from .grid import EMPTY, KIND_PR, KIND_TH, KIND_TH_PR, PINNED_KINDS
+from .instrument import timed
+from .rooms import LAB, LECTURE, RoomPool
+from .solver import UNASSIGNED_TEACHER, Occupancy, _pick_room, _pick_teacher
+
+
+def _bits(period, width):
+    return ((1 << width) - 1) << period
+
+
+class _Repair:
+    """Shared teacher/room bookings rebuilt from the timetable, plus lift/drop helpers."""
+
+    def __init__(self, timetable, rng, rooms=None):
+        self.tt = timetable
+        self.rng = rng
+        self.occupancy = Occupancy(len(timetable.days))
+        self.pool = RoomPool(rooms, len(timetable.days), len(timetable.periods)) if rooms else None
+        self.teacher_load = {}
+        self.stats = {"removed": 0, "added": 0, "reassigned": 0}
+        d, p, c = np.nonzero(timetable.subject != EMPTY)
+        for day, period, cls in zip(d.tolist(), p.tolist(), c.tolist()):
+            self._book(self.teacher_at(day, period, cls), timetable.rooms[timetable.room[day, period, cls]],
+                       day, period, 1)
+
+    def teacher_at(self, day, period, cls):
+        return self.tt.teachers[self.tt.teacher[day, period, cls]]
+
+    def _book(self, teacher, room, day, period, width):
+        bits = _bits(period, width)
+        if teacher != UNASSIGNED_TEACHER:
+            self.occupancy.book(teacher, day, bits)
+            self.teacher_load[teacher] = self.teacher_load.get(teacher, 0) + width
+        self.occupancy.book(room, day, bits)
+        if self.pool is not None:
+            self.pool.book(room, day, range(period, period + width))
+
+    def _release_teacher(self, teacher, day, bits, n):
+        if teacher != UNASSIGNED_TEACHER:
+            self.occupancy.release(teacher, day, bits)
+            self.teacher_load[teacher] -= n
+
+    def lift(self, c, lesson):
+        day, period, width = lesson
+        bits = _bits(period, width)
+        room = self.tt.rooms[self.tt.room[day, period, c]]
+        self._release_teacher(self.teacher_at(day, period, c), day, bits, width)
+        self.occupancy.release(room, day, bits)
+        if self.pool is not None:
+            self.pool.release(room, day, range(period, period + width))
+        for p in range(period, period + width):
+            self.tt.clear(day, p, c)
+        self.stats["removed"] += width
+
+    def reassign(self, c, lesson, candidates):
+        """Give ``lesson`` a free teacher from ``candidates`` in the same slot; False if none is free."""
+        day, period, width = lesson
+        bits = _bits(period, width)
+        old = self.teacher_at(day, period, c)
+        self._release_teacher(old, day, bits, width)
+        teacher = _pick_teacher(candidates, day, bits, self.occupancy, self.teacher_load, self.rng)
+        if teacher is None:
+            if old != UNASSIGNED_TEACHER:
+                self.occupancy.book(old, day, bits)
+                self.teacher_load[old] += width
+            return False
+        if teacher != UNASSIGNED_TEACHER:
+            self.occupancy.book(teacher, day, bits)
+            self.teacher_load[teacher] = self.teacher_load.get(teacher, 0) + width
+        self.tt.teacher[day, period:period + width, c] = self.tt.teachers.intern(teacher)
+        self.stats["reassigned"] += width
+        return True
+
+    def drop(self, c, subject, candidates, class_room, width, kind, day_counts, class_size=0):
+        """Place a new lesson in the free slot whose day has the fewest lessons of ``subject``.
+
+        The room is picked as the solver does: the class's own room, or a pool
+        lab for practicals / a pool lecture room when the own room is taken.
+        """
+        tt = self.tt
+        class_load = (tt.subject[:, :, c] != EMPTY).sum(axis=1)
+        best = None
+        for day in range(len(tt.days)):
+            teaching = tt.open_mask(day, c)
+            for period in range(len(tt.periods) - width + 1):
+                cells = slice(period, period + width)
+                bits = _bits(period, width)
+                if teaching & bits != bits or (tt.subject[day, cells, c] != EMPTY).any():
+                    continue
+                key = (day_counts[day], class_load[day], day, period)
+                if best is not None and key >= best[0]:
+                    continue
+                room = _pick_room(class_room, day, period, width, LAB if kind == KIND_PR else LECTURE,
+                                  subject, class_size, self.occupancy, self.pool)
+                if room is None:
+                    continue
+                teacher = _pick_teacher(candidates, day, bits, self.occupancy, self.teacher_load, self.rng)
+                if teacher is not None:
+                    best = (key, day, period, teacher, room)
+        if best is None:
+            return None
+        _, day, period, teacher, room = best
+        self._book(teacher, room, day, period, width)
+        for p in range(period, period + width):
+            tt.place(day, p, c, subject, teacher, room, kind)
+        day_counts[day] += 1
+        self.stats["added"] += width
+        return day, period, width
+
+
+def _lessons(timetable, c):
+    """``{subject id: [(day, period, width), ...]}`` in week order; a practical pair has width 2."""
+    subject, kind = timetable.subject[:, :, c], timetable.kind[:, :, c]
+    n_days, n_periods = subject.shape
+    lessons = {}
+    for day in range(n_days):
+        period = 0
+        while period < n_periods:
+            s = int(subject[day, period])
+            if s == EMPTY:
+                period += 1
+                continue
+            width = 2 if (kind[day, period] == KIND_PR and period + 1 < n_periods
+                          and kind[day, period + 1] == KIND_PR and subject[day, period + 1] == s) else 1
+            lessons.setdefault(s, []).append((day, period, width))
+            period += width
+    return lessons
+
+
+def _repair_class(state, class_key, subject_teacher_map, subject_hours, class_room, subjects=None, class_size=0):
+    tt = state.tt
+    c = tt.class_index(class_key)
+    placed = {tt.subjects[s]: lessons for s, lessons in _lessons(tt, c).items()}
+    # Pinned coaching sessions count towards their subject's hours but are never moved
+    pinned = {subject: [lesson for lesson in lessons if tt.kind[lesson[0], lesson[1], c] in PINNED_KINDS]
+              for subject, lessons in placed.items()}
+    for subject, lessons in placed.items():
+        if subject not in subject_hours:
+            for lesson in lessons:
+                if lesson not in pinned[subject]:
+                    state.lift(c, lesson)
+
+    missing = {s: n for s, n in tt.unplaced.get(class_key, {}).items() if s in subject_hours}
+    for subject, hours in subject_hours.items():
+        if subjects is not None and subject not in subjects:
+            continue
+        fixed = pinned.get(subject, [])
+        lessons = [lesson for lesson in placed.get(subject, []) if lesson not in fixed]
+        pairs = [lesson for lesson in lessons if lesson[2] == 2]
+        singles = [lesson for lesson in lessons if lesson[2] == 1]
+        target = max(0, hours['TH'] + hours['PR'] - len(fixed))
+        pair_target = min(hours['PR'] // 2, target // 2)
+        candidates = subject_teacher_map.get(subject) or [UNASSIGNED_TEACHER]
+
+        # Surplus: practical pairs beyond the PR hours, then the last single periods of the
+        # week, keeping room for the pairs still owed
+        while len(pairs) > pair_target:
+            state.lift(c, pairs.pop())
+        while singles and 2 * pair_target + len(singles) > target:
+            state.lift(c, singles.pop())
+        while 2 * len(pairs) + len(singles) > target:
+            state.lift(c, pairs.pop())
+
+        # Teachers no longer mapped to the subject
+        for group in (pairs, singles):
+            for lesson in list(group):
+                if state.teacher_at(lesson[0], lesson[1], c) in candidates:
+                    continue
+                if not state.reassign(c, lesson, candidates):
+                    state.lift(c, lesson)
+                    group.remove(lesson)
+
+        single_kind = KIND_TH_PR if hours['PR'] > 0 else KIND_TH
+        for day, period, _ in singles:
+            tt.kind[day, period, c] = single_kind
+
+        # Shortfall: new practical pairs first, as the full solver does, then single periods
+        day_counts = [0] * len(tt.days)
+        for day, _, _ in pairs + singles:
+            day_counts[day] += 1
+        while len(pairs) < pair_target and 2 * len(pairs) + len(singles) + 2 <= target:
+            lesson = state.drop(c, subject, candidates, class_room, 2, KIND_PR, day_counts, class_size)
+            if lesson is None:
+                break
+            pairs.append(lesson)
+        while 2 * len(pairs) + len(singles) < target:
+            lesson = state.drop(c, subject, candidates, class_room, 1, single_kind, day_counts, class_size)
+            if lesson is None:
+                break
+            singles.append(lesson)
+
+        short = target - 2 * len(pairs) - len(singles)
+        if short > 0:
+            missing[subject] = short
+        else:
+            missing.pop(subject, None)
+
+    if missing:
+        tt.unplaced[class_key] = missing
+    else:
+        tt.unplaced.pop(class_key, None)
+
+
+def changed_subjects(old_subject_teacher_map, old_class_subject_hours, subject_teacher_map, class_subject_hours):
+    """``{class key: {subjects}}`` whose hours, presence or teacher list differ between two inputs."""
+    changed = {}
+    for class_key, subject_hours in class_subject_hours.items():
+        old_hours = old_class_subject_hours.get(class_key, {})
+        subjects = {
+            subject for subject in set(subject_hours) | set(old_hours)
+            if subject_hours.get(subject) != old_hours.get(subject)
+            or subject_teacher_map.get(subject) != old_subject_teacher_map.get(subject)
+        }
+        if subjects:
+            changed[class_key] = subjects
+    return changed
+
+
+@timed("repair", lambda stats: {key: stats[key] for key in ("removed", "added", "reassigned", "unplaced")})
+def repair(timetable, subject_teacher_map, class_subject_hours, class_rooms, previous=None, rng=None,
+           rooms=None, class_sizes=None):
+    """Bring ``timetable`` in line with new hours/teachers in place, moving as little as possible.
+
+    ``class_subject_hours`` and ``class_rooms`` have the same shape as for
+    :func:`~ttg.solver.generate_institution_timetables` but only need the
+    classes to check; other classes are left exactly as they are (their
+    bookings still block teachers and rooms). With ``previous`` (the
+    ``(subject_teacher_map, class_subject_hours)`` the timetable was solved
+    from) only the subjects that changed are touched; without it every
+    subject of the given classes is reconciled with its hours. ``rooms`` and
+    ``class_sizes`` are the room pool the timetable was solved with.
+
+    Returns a stats dict with the number of periods ``removed``, ``added``
+    and ``reassigned`` to another teacher, the total ``unplaced`` periods and
+    ``elapsed`` seconds.
+    """
+    unknown = [k for k in class_subject_hours if k not in timetable.classes]
+    if unknown:
+        raise ValueError(f"Classes not in this timetable (generate a new one instead): {', '.join(unknown)}")
+    start = time.perf_counter()
+    scope = changed_subjects(*previous, subject_teacher_map, class_subject_hours) if previous else None
+    state = _Repair(timetable, rng or random, rooms)
+    class_sizes = class_sizes or {}
+    for class_key, subject_hours in class_subject_hours.items():
+        if scope is not None and class_key not in scope:
+            continue
+        _repair_class(state, class_key, subject_teacher_map, subject_hours, class_rooms[class_key],
+                      scope[class_key] if scope is not None else None, class_sizes.get(class_key, 0))
+    return {
+        **state.stats,
+        "unplaced": sum(sum(missing.values()) for missing in timetable.unplaced.values()),
+        "elapsed": time.perf_counter() - start,
+    }
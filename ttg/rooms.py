@@ -0,0 +1,94 @@
+"""Room and lab pool loaded from the optional ``Rooms`` sheet, allocated per slot.
+
+The sheet has a ``Room`` column and optionally ``Type`` (anything containing
+"lab" is a lab, everything else a lecture room), ``Capacity`` and
+``Subjects`` (comma separated; a room listing subjects is reserved for them).
+"""
+import collections
+
+import pandas as pd
+
+LECTURE = "lecture"
+LAB = "lab"
+
+Room = collections.namedtuple("Room", ["name", "kind", "capacity", "subjects"])
+
+
+def rooms_from_frame(df):
+    """``[Room]`` from a Rooms sheet; blank names are skipped and a missing capacity means "fits any class"."""
+    if df is None or "Room" not in df.columns:
+        return []
+    names = df["Room"].astype(str).str.strip()
+    kinds = df["Type"].astype(str).str.lower() if "Type" in df.columns else pd.Series("", index=df.index)
+    capacity = pd.to_numeric(df["Capacity"], errors="coerce") if "Capacity" in df.columns else None
+    subjects = df["Subjects"] if "Subjects" in df.columns else None
+    rooms = []
+    for i in df.index:
+        name = names[i]
+        if not name or name == "nan":
+            continue
+        cap = capacity[i] if capacity is not None else None
+        listed = subjects[i] if subjects is not None else None
+        rooms.append(Room(
+            name,
+            LAB if "lab" in kinds[i] else LECTURE,
+            int(cap) if cap is not None and cap == cap else 0,
+            tuple(s.strip() for s in str(listed).split(",") if s.strip()) if isinstance(listed, str) else (),
+        ))
+    return rooms
+
+
+class RoomPool:
+    """Free-room bitsets per ``(day, period)``: bit ``i`` is set while room ``i`` is free.
+
+    Rooms are ordered smallest first, so the lowest free bit of a candidate
+    mask is the best-fitting room and finding one is a few integer ANDs
+    however many rooms there are.
+    """
+
+    def __init__(self, rooms, n_days, n_periods):
+        self.rooms = sorted(rooms, key=lambda r: (r.capacity or float("inf"), r.name))
+        self.index = {room.name: i for i, room in enumerate(self.rooms)}
+        everything = (1 << len(self.rooms)) - 1
+        self.free = [[everything] * n_periods for _ in range(n_days)]
+        self._groups = {}
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def has(self, kind):
+        return any(room.kind == kind for room in self.rooms)
+
+    def _candidates(self, kind, subject, size):
+        """``(reserved for subject, open to any subject)`` masks of rooms of ``kind`` that seat ``size``."""
+        key = (kind, subject, size)
+        masks = self._groups.get(key)
+        if masks is None:
+            fits = [i for i, room in enumerate(self.rooms)
+                    if room.kind == kind and (not size or not room.capacity or room.capacity >= size)]
+            masks = self._groups[key] = (
+                sum(1 << i for i in fits if subject in self.rooms[i].subjects),
+                sum(1 << i for i in fits if not self.rooms[i].subjects),
+            )
+        return masks
+
+    def find(self, day, periods, kind, subject=None, size=0):
+        """Name of the smallest free room of ``kind`` for all ``periods`` of ``day``, or ``None``."""
+        for mask in self._candidates(kind, subject, size):
+            for p in periods:
+                mask &= self.free[day][p]
+            if mask:
+                return self.rooms[(mask & -mask).bit_length() - 1].name
+        return None
+
+    def book(self, name, day, periods):
+        i = self.index.get(name)
+        if i is not None:
+            for p in periods:
+                self.free[day][p] &= ~(1 << i)
+
+    def release(self, name, day, periods):
+        i = self.index.get(name)
+        if i is not None:
+            for p in periods:
+                self.free[day][p] |= 1 << i
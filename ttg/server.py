@@ -0,0 +1,510 @@
+"""Local HTTP job API: queue timetable jobs and solve them on a bounded process pool.
+
+Workbooks are uploaded once (``POST /workbooks``) and referred to by their
+SHA-256; a job is that digest plus the options of the command line (see
+:func:`ttg.cli.build_parser`) as JSON. Jobs are solved in worker processes,
+where :func:`~ttg.loader.load_workbook` keeps recently parsed workbooks in
+memory and all workers share the on-disk snapshots, so a workbook is parsed
+about once however many jobs use it. At most ``max_pending`` jobs and
+workbook exports are queued or running; past that a new one is refused with
+``503`` and ``Retry-After`` rather than piling up.
+
+Routes::
+
+    GET    /health               workers, pending jobs and capacity
+    POST   /workbooks            xlsx body -> {"workbook": sha256}
+    POST   /jobs                 {"workbook": sha256, options...} -> 202 {"id", "state", ...}
+                                 (or an xlsx body with the options in the query string)
+    GET    /jobs                 every job still kept
+    GET    /jobs/<id>[?wait=S]   state, plus the result once done (waits up to S seconds)
+    GET    /jobs/<id>/xlsx       master workbook; ?class=10 A or ?teacher=NAME for one of them
+    GET    /jobs/<id>/zip        one workbook per class and per teacher plus the master
+    DELETE /jobs/<id>            cancel a queued job or forget a finished one
+
+Example::
+
+    python -m ttg.server --port 8750 --workers 4
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .cli import build_parser, prepare
+from .export import XLSX_MIME, class_workbook, master_workbook, safe_filename, teacher_workbook, write_zip
+from .instrument import StageTimer
+from .loader import snapshot_dir
+from .quality import evaluate
+from .versions import draw_seeds, generate_candidates, regenerate
+
+# Command-line options that make no sense for a job (output files, local processes, logging)
+CLI_ONLY = {"workbook", "out", "zip", "save", "independent", "workers", "keep", "log_json", "profile"}
+# Options given more than once on the command line; a job passes a list
+REPEATED = {"day_end", "shift", "class_shift"}
+# Longest a status request may wait for its job, in seconds
+MAX_WAIT = 60
+# Largest request body accepted (an uploaded workbook), in bytes
+MAX_BODY = 50 * 1024 * 1024
+# Seconds a refused client is told to wait before retrying
+RETRY_AFTER = 2
+_XLSX_MAGIC = b"PK\x03\x04"
+
+
+class QueueFull(Exception):
+    """Raised when ``max_pending`` jobs and exports are already queued or running."""
+
+
+def _reject(message):
+    raise ValueError(message)
+
+
+def job_options(options):
+    """Validate a job's options into the namespace :func:`~ttg.cli.prepare` takes; raises ``ValueError``.
+
+    Keys are the command-line option names with underscores (``short_break``,
+    ``optimize_moves``, ...). ``sections`` and ``classes`` may be lists,
+    ``day_end``/``shift``/``class_shift`` are lists of ``"A=B"`` strings and
+    ``hours`` is the mapping a ``--hours`` file holds.
+    """
+    parser = build_parser()
+    # A bad option must reach the client, not exit the server
+    parser.error = _reject
+    job_keys = set(vars(parser.parse_args(["-"]))) - CLI_ONLY
+    unknown = sorted(set(options) - job_keys)
+    if unknown:
+        raise ValueError(f"Unsupported option(s): {', '.join(unknown)}")
+    hours = options.get("hours")
+    if hours is not None and not isinstance(hours, dict):
+        raise ValueError("hours must map subject -> {\"TH\": n, \"PR\": n}")
+
+    argv = ["-"]
+    for key, value in options.items():
+        if key == "hours" or value is None:
+            continue
+        flag = "--" + key.replace("_", "-")
+        if key in REPEATED:
+            for item in value if isinstance(value, list) else [value]:
+                argv += [flag, str(item)]
+        else:
+            argv += [flag, ",".join(map(str, value)) if isinstance(value, list) else str(value)]
+    args = parser.parse_args(argv)
+    args.hours = hours
+    return args
+
+
+def _init_worker():
+    # Ctrl-C reaches the whole process group; the server shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_job(workbook_path, args, job_id):
+    """Solve one job in a pool worker; returns ``(result dict, timetable)``."""
+    timer = StageTimer(run_id=job_id).install()
+    args.workbook = workbook_path
+    with timer.stage("prepare"):
+        prepared = prepare(args, _reject)
+    if not prepared.class_specs:
+        raise ValueError("No classes with subjects to schedule")
+    if args.candidates > 1:
+        # One worker per job already; candidates stay in this process
+        best = generate_candidates(prepared.job, args.candidates, base_seed=args.seed, workers=1)[0]
+    else:
+        seed = args.seed if args.seed is not None else draw_seeds(1)[0]
+        best = {"seed": seed, "metrics": None, "timetable": regenerate(prepared.job, seed)}
+    timetable = best["timetable"]
+    with timer.stage("render"):
+        result = {
+            "seed": best["seed"],
+            "metrics": best["metrics"] or evaluate(timetable),
+            "issues": [issue.message for issue in prepared.report["issues"]],
+            "skipped": prepared.skipped,
+            "unplaced": timetable.unplaced,
+            "days": timetable.days,
+            "periods": timetable.periods,
+            "classes": {key: timetable.class_frame(key).values.tolist() for key in timetable.classes.names},
+            "teacher_loads": timetable.teacher_loads(),
+        }
+    result["phases"] = timer.rows()
+    return result, timetable
+
+
+def render(timetable, kind, name=None):
+    """xlsx (or ZIP) bytes of a solved timetable, built in a pool worker."""
+    if kind == "class":
+        return class_workbook(timetable, name)
+    output = io.BytesIO()
+    if kind == "teacher":
+        teacher_workbook(timetable, name, output)
+    elif kind == "zip":
+        write_zip(timetable, output, workers=1)
+    else:
+        master_workbook(timetable, output)
+    return output.getvalue()
+
+
+def _json_default(value):
+    # numpy scalars from the metrics and loads
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class Job:
+    """One submitted job and the future of its result."""
+
+    def __init__(self, job_id, workbook, options, future):
+        self.id = job_id
+        self.workbook = workbook
+        self.options = options
+        self.future = future
+        self.created = time.time()
+        self.finished = None
+        self.exports = {}
+
+    @property
+    def state(self):
+        future = self.future
+        if future.cancelled():
+            return "cancelled"
+        if future.done():
+            return "failed" if future.exception() else "done"
+        return "running" if future.running() else "queued"
+
+    def summary(self):
+        summary = {"id": self.id, "state": self.state, "workbook": self.workbook, "options": self.options,
+                   "created": self.created, "finished": self.finished}
+        if summary["state"] == "failed":
+            summary["error"] = str(self.future.exception())
+        return summary
+
+
+class JobQueue:
+    """Uploaded workbooks, submitted jobs and the process pool that solves them; thread-safe.
+
+    ``max_pending`` bounds the jobs and exports queued or running at once
+    (default: four per worker); the newest ``max_jobs`` jobs are kept for
+    their results.
+    """
+
+    def __init__(self, workers=None, max_pending=None, data_dir=None, max_jobs=256):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.max_jobs = max_jobs
+        self.data_dir = data_dir or os.path.join(snapshot_dir(), "workbooks")
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Pool tasks (jobs and exports) queued or running
+        self._in_flight = 0
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        # Start every worker now, forked from this one thread rather than from a request thread
+        self._pool.submit(int).result()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._in_flight
+
+    def _submit(self, function, *args):
+        """Run ``function`` in the pool unless ``max_pending`` tasks are in flight (:class:`QueueFull`)."""
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs and exports already queued or running")
+            self._in_flight += 1
+        try:
+            future = self._pool.submit(function, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def workbook_path(self, digest):
+        if not re.fullmatch(r"[0-9a-f]{64}", digest or ""):
+            raise KeyError(f"Unknown workbook {digest!r}; upload it to /workbooks first")
+        path = os.path.join(self.data_dir, f"{digest}.xlsx")
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown workbook {digest!r}; upload it to /workbooks first")
+        return path
+
+    def add_workbook(self, data):
+        """Keep an uploaded workbook and return its SHA-256 (uploading it again is free)."""
+        if not data.startswith(_XLSX_MAGIC):
+            raise ValueError("Expected an .xlsx workbook")
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.data_dir, f"{digest}.xlsx")
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=self.data_dir, suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def submit(self, digest, options):
+        """Queue a job; raises ``KeyError`` (workbook), ``ValueError`` (options) or :class:`QueueFull`."""
+        path = self.workbook_path(digest)
+        args = job_options(options)
+        job_id = uuid.uuid4().hex[:12]
+        future = self._submit(run_job, path, args, job_id)
+        job = Job(job_id, digest, options, future)
+        future.add_done_callback(lambda _: self._finish(job))
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        return job
+
+    def _finish(self, job):
+        job.finished = time.time()
+
+    def _evict(self):
+        # Oldest finished jobs go first; queued and running ones are never dropped
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job.id for job in self._jobs.values() if job.future.done()][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job {job_id!r}")
+        return job
+
+    def wait(self, job_id, timeout):
+        job = self.get(job_id)
+        concurrent.futures.wait([job.future], timeout=min(max(timeout, 0), MAX_WAIT))
+        return job
+
+    def remove(self, job_id):
+        """Cancel a queued job and forget it; a running job is left to finish."""
+        job = self.get(job_id)
+        if job.future.cancel() or job.future.done():
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            return True
+        return False
+
+    def export(self, job_id, kind, name=None):
+        """xlsx bytes of a finished job, rendered once in the pool and then kept with the job.
+
+        A render takes a pool slot like a job, so it raises :class:`QueueFull` when none is free.
+        """
+        job = self.get(job_id)
+        if job.state != "done":
+            raise ValueError(f"Job {job_id} is {job.state}, not done")
+        timetable = job.future.result()[1]
+        if kind == "class" and name not in timetable.classes:
+            raise KeyError(f"No class {name!r} in job {job_id}")
+        if kind == "teacher" and name not in timetable.teachers:
+            raise KeyError(f"No teacher {name!r} in job {job_id}")
+        key = (kind, name)
+        with self._lock:
+            future = job.exports.get(key)
+        if future is None:
+            # Submitted outside the lock: the slot is released under it, possibly right away
+            future = self._submit(render, timetable, kind, name)
+            with self._lock:
+                future = job.exports.setdefault(key, future)
+        try:
+            return future.result()
+        except Exception:
+            # A failed render is not kept, so asking again retries it
+            with self._lock:
+                if job.exports.get(key) is future:
+                    del job.exports[key]
+            raise
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Routes requests to the server's :class:`JobQueue`."""
+
+    server_version = "ttg"
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("GET", r"/health", "health"),
+        ("POST", r"/workbooks", "upload"),
+        ("GET", r"/jobs", "list_jobs"),
+        ("POST", r"/jobs", "create"),
+        ("GET", r"/jobs/(\w+)", "status"),
+        ("DELETE", r"/jobs/(\w+)", "delete"),
+        ("GET", r"/jobs/(\w+)/xlsx", "xlsx"),
+        ("GET", r"/jobs/(\w+)/zip", "zip"),
+    ]
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+        allowed = []
+        for verb, pattern, route in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match is None:
+                continue
+            if verb != method:
+                allowed.append(verb)
+                continue
+            try:
+                return getattr(self, route)(*match.groups())
+            except QueueFull as e:
+                return self._send_json(503, {"error": str(e)}, {"Retry-After": str(RETRY_AFTER)})
+            except KeyError as e:
+                return self._send_json(404, {"error": e.args[0] if e.args else "Not found"})
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            except ConnectionError:
+                raise
+            except Exception as e:
+                self.log_error("%s %s failed: %r", method, path, e)
+                return self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        if allowed:
+            return self._send_json(405, {"error": f"{method} not allowed on {path}"}, {"Allow": ", ".join(allowed)})
+        self._send_json(404, {"error": f"No route {path}"})
+
+    # --- Plumbing ---
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.close_connection = True
+            raise ValueError(f"Request body over {MAX_BODY // (1024 * 1024)} MB")
+        return self.rfile.read(length)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, default=_json_default).encode(), "application/json", headers)
+
+    def _send_file(self, data, filename, content_type=XLSX_MIME):
+        self._send(200, data, content_type,
+                   {"Content-Disposition": f'attachment; filename="{safe_filename(filename)}"'})
+
+    # --- Routes ---
+    def health(self):
+        queue = self.server.queue
+        self._send_json(200, {"workers": queue.workers, "pending": queue.pending, "max_pending": queue.max_pending,
+                              "jobs": len(queue.jobs())})
+
+    def upload(self):
+        self._send_json(201, {"workbook": self.server.queue.add_workbook(self._body())})
+
+    def list_jobs(self):
+        self._send_json(200, {"jobs": [job.summary() for job in self.server.queue.jobs()]})
+
+    def create(self):
+        body = self._body()
+        queue = self.server.queue
+        if body.startswith(_XLSX_MAGIC):
+            digest, options = queue.add_workbook(body), dict(self.query)
+        else:
+            try:
+                options = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+            if not isinstance(options, dict):
+                raise ValueError("Expected a JSON object")
+            digest = options.pop("workbook", None)
+        job = queue.submit(digest, options)
+        self._send_json(202, job.summary(), {"Location": f"/jobs/{job.id}"})
+
+    def status(self, job_id):
+        queue = self.server.queue
+        job = queue.wait(job_id, float(self.query.get("wait", 0)))
+        summary = job.summary()
+        if summary["state"] == "done":
+            summary["result"] = job.future.result()[0]
+        self._send_json(200, summary)
+
+    def delete(self, job_id):
+        if not self.server.queue.remove(job_id):
+            return self._send_json(409, {"error": f"Job {job_id} is running"})
+        self._send_json(200, {"id": job_id, "removed": True})
+
+    def xlsx(self, job_id):
+        for kind in ("class", "teacher"):
+            if kind in self.query:
+                name = self.query[kind]
+                return self._send_file(self.server.queue.export(job_id, kind, name), f"{name}_Timetable.xlsx")
+        self._send_file(self.server.queue.export(job_id, "master"), f"{job_id}_Master_Timetable.xlsx")
+
+    def zip(self, job_id):
+        self._send_file(self.server.queue.export(job_id, "zip"), f"{job_id}_Timetables.zip", "application/zip")
+
+
+def make_server(host="127.0.0.1", port=8750, **queue_options):
+    """A ``ThreadingHTTPServer`` serving a new :class:`JobQueue` (``server.queue``); call ``serve_forever``."""
+    queue = JobQueue(**queue_options)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.queue = queue
+    return server
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ttg.server", description="Serve timetable generation jobs over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8750, help="Port (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="Worker processes solving jobs (default: CPU count)")
+    parser.add_argument("--max-pending", type=int,
+                        help="Jobs and exports queued or running before new ones get 503 (default: 4 per worker)")
+    parser.add_argument("--max-jobs", type=int, default=256, help="Finished jobs kept for their results")
+    parser.add_argument("--data-dir", help="Where uploaded workbooks are kept (default: under $TTG_CACHE_DIR)")
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, workers=args.workers, max_pending=args.max_pending,
+                         data_dir=args.data_dir, max_jobs=args.max_jobs)
+    queue = server.queue
+    print(f"serving on http://{args.host}:{server.server_port} with {queue.workers} workers "
+          f"(up to {queue.max_pending} pending jobs)", file=sys.stderr)
+    # Stop as on Ctrl-C when a service manager or ``docker stop`` sends SIGTERM
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
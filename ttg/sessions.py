@@ -0,0 +1,55 @@
+"""Coaching sessions with exact times, checked through a per-resource interval index.
+
+A fixed session (subject, day, ``"HH:MM"`` start, minutes, faculty) can start
+at any minute and last any length. It is checked against every other
+session of the same faculty or room with an :class:`IntervalIndex`, then
+pinned onto the grid periods it overlaps. A flexible session (name, number
+of periods, preferred day) takes the first free block of consecutive
+teaching periods on its day, or on the least busy day for ``"Any"``.
+"""
+import bisect
+
+
+class IntervalIndex:
+    """Sorted, non-overlapping ``[start, end)`` intervals per ``(resource, day)``.
+
+    ``overlap`` and ``add`` are a binary search plus a neighbour check, so
+    checking a session costs O(log n) however many batches share a faculty.
+    """
+
+    def __init__(self):
+        self._starts = {}
+        self._items = {}
+
+    def overlap(self, resource, day, start, end):
+        """The label of an interval overlapping ``[start, end)``, or ``None``."""
+        starts = self._starts.get((resource, day))
+        if not starts:
+            return None
+        items = self._items[(resource, day)]
+        i = bisect.bisect_left(starts, end)
+        # Intervals never overlap each other, so only the one starting last before ``end`` can reach back
+        if i and items[i - 1][1] > start:
+            return items[i - 1][2]
+        return None
+
+    def add(self, resource, day, start, end, label):
+        starts = self._starts.setdefault((resource, day), [])
+        items = self._items.setdefault((resource, day), [])
+        i = bisect.bisect_left(starts, start)
+        starts.insert(i, start)
+        items.insert(i, (start, end, label))
+
+
+def session_periods(intervals, open_mask, start, end):
+    """Indexes of the teaching periods (set bits of ``open_mask``) that overlap ``[start, end)``."""
+    return [p for p, (lo, hi) in enumerate(intervals) if open_mask >> p & 1 and lo < end and start < hi]
+
+
+def free_block(busy_mask, open_mask, width):
+    """First period index of ``width`` consecutive free teaching periods, or ``None``."""
+    for period in range(open_mask.bit_length() - width + 1):
+        bits = ((1 << width) - 1) << period
+        if not busy_mask & bits and open_mask & bits == bits:
+            return period
+    return None
@@ -0,0 +1,346 @@
+import random
+
+from .grid import EMPTY, KIND_FIXED, KIND_PR, KIND_SESSION, KIND_TH, KIND_TH_PR, Timetable
+from .instrument import timed
+from .rooms import LAB, LECTURE, RoomPool
+from .calendar import calendar_for, format_minutes, to_minutes
+from .sessions import IntervalIndex, free_block, session_periods
+
+# Placeholder teacher used when a subject has no mapped faculty; it is never
+# booked, so it cannot cause conflicts.
+UNASSIGNED_TEACHER = "TBD"
+
+
+class Occupancy:
+    """Day x period bitmasks per resource (teacher or room), shared across classes.
+
+    Bit ``i`` of a resource's mask for a day is set when it is booked in period
+    index ``i`` of that day, so a conflict check is a single AND.
+    """
+
+    def __init__(self, n_days):
+        self.n_days = n_days
+        self._busy = {}
+
+    def mask(self, resource, day):
+        row = self._busy.get(resource)
+        return row[day] if row else 0
+
+    def is_free(self, resource, day, bits):
+        row = self._busy.get(resource)
+        return row is None or not row[day] & bits
+
+    def book(self, resource, day, bits):
+        row = self._busy.get(resource)
+        if row is None:
+            row = self._busy[resource] = [0] * self.n_days
+        row[day] |= bits
+
+    def release(self, resource, day, bits):
+        row = self._busy.get(resource)
+        if row is not None:
+            row[day] &= ~bits
+
+    def load(self, resource):
+        row = self._busy.get(resource)
+        return sum(bin(m).count("1") for m in row) if row else 0
+
+    def resources(self):
+        return list(self._busy)
+
+
+def _pick_teacher(candidates, day, bits, occupancy, teacher_load, rng):
+    """Choose a free qualified teacher, preferring the least loaded one."""
+    free = [t for t in candidates if t == UNASSIGNED_TEACHER or occupancy.is_free(t, day, bits)]
+    if not free:
+        return None
+    least = min(teacher_load.get(t, 0) for t in free)
+    return rng.choice([t for t in free if teacher_load.get(t, 0) == least])
+
+
+def _book(teacher, day, bits, n, occupancy, teacher_load):
+    if teacher != UNASSIGNED_TEACHER:
+        occupancy.book(teacher, day, bits)
+        teacher_load[teacher] = teacher_load.get(teacher, 0) + n
+
+
+def _class_slot(class_key):
+    """Occupancy key marking a class busy, kept apart from the rooms it uses."""
+    return ("class", class_key)
+
+
+def _book_room(room, day, period, width, occupancy, pool):
+    occupancy.book(room, day, ((1 << width) - 1) << period)
+    if pool is not None:
+        pool.book(room, day, range(period, period + width))
+
+
+def _pick_room(class_room, day, period, width, kind, subject, size, occupancy, pool):
+    """The class's own room when free, else the smallest free pool room of ``kind`` (labs for practicals)."""
+    bits = ((1 << width) - 1) << period
+    if pool is None:
+        # No Rooms sheet: the class's room is booked by its name as given, an empty one included
+        return class_room if occupancy.is_free(class_room, day, bits) else None
+    if class_room and (kind == LECTURE or not pool.has(LAB)):
+        if occupancy.is_free(class_room, day, bits):
+            return class_room
+    return pool.find(day, range(period, period + width), kind, subject, size)
+
+
+def _solve_class(timetable, class_key, subject_teacher_map, subject_hours, class_room,
+                 occupancy, teacher_load, rng, pool=None, class_size=0):
+    """Greedy pass over one class: practical pairs first, then theory by remaining hours."""
+    c = timetable.class_index(class_key)
+    periods = timetable.periods
+    busy = _class_slot(class_key)
+    subject_alloc = {sub: 0 for sub in subject_hours}
+    pr_subjects = [s for s in subject_hours if subject_hours[s]['PR'] >= 2]
+
+    for d in range(len(timetable.days)):
+        teaching = timetable.open_mask(d, c)
+        i = 0
+        while i < len(periods):
+            bit = 1 << i
+            if not teaching & bit or not occupancy.is_free(busy, d, bit):
+                i += 1
+                continue
+
+            if teaching & (bit << 1):
+                pair = bit | (bit << 1)
+                placed = False
+                if occupancy.is_free(busy, d, pair):
+                    for subject in pr_subjects:
+                        if subject_alloc[subject] + 2 > subject_hours[subject]['PR']:
+                            continue
+                        room = _pick_room(class_room, d, i, 2, LAB, subject, class_size, occupancy, pool)
+                        if room is None:
+                            continue
+                        candidates = subject_teacher_map.get(subject) or [UNASSIGNED_TEACHER]
+                        teacher = _pick_teacher(candidates, d, pair, occupancy, teacher_load, rng)
+                        if teacher is None:
+                            continue
+                        _book(teacher, d, pair, 2, occupancy, teacher_load)
+                        occupancy.book(busy, d, pair)
+                        _book_room(room, d, i, 2, occupancy, pool)
+                        subject_alloc[subject] += 2
+                        timetable.place(d, i, c, subject, teacher, room, KIND_PR)
+                        timetable.place(d, i + 1, c, subject, teacher, room, KIND_PR)
+                        placed = True
+                        break
+                if placed:
+                    i += 2
+                    continue
+
+            valid_subjects = [s for s in subject_hours if subject_alloc[s] < subject_hours[s]['TH'] + subject_hours[s]['PR']]
+            if not valid_subjects:
+                break
+            # Most remaining hours first; ties are broken randomly so different seeds give different layouts
+            valid_subjects.sort(key=lambda s: ((subject_hours[s]['TH'] + subject_hours[s]['PR']) - subject_alloc[s], rng.random()),
+                                reverse=True)
+
+            for subject in valid_subjects:
+                room = _pick_room(class_room, d, i, 1, LECTURE, subject, class_size, occupancy, pool)
+                if room is None:
+                    continue
+                candidates = subject_teacher_map.get(subject) or [UNASSIGNED_TEACHER]
+                teacher = _pick_teacher(candidates, d, bit, occupancy, teacher_load, rng)
+                if teacher is None:
+                    continue
+                _book(teacher, d, bit, 1, occupancy, teacher_load)
+                occupancy.book(busy, d, bit)
+                _book_room(room, d, i, 1, occupancy, pool)
+                subject_alloc[subject] += 1
+                kind = KIND_TH_PR if subject_hours[subject]['PR'] > 0 else KIND_TH
+                timetable.place(d, i, c, subject, teacher, room, kind)
+                break
+            i += 1
+
+    return {
+        s: subject_hours[s]['TH'] + subject_hours[s]['PR'] - subject_alloc[s]
+        for s in subject_hours
+        if subject_alloc[s] < subject_hours[s]['TH'] + subject_hours[s]['PR']
+    }
+
+
+# --- Coaching sessions: pinned before the greedy fill ---
+def _pin_sessions(timetable, class_subject_hours, class_rooms, fixed_sessions, flexible_sessions,
+                  occupancy, teacher_load, pool=None):
+    """Pin fixed sessions, then place flexible ones; return the hours left for the greedy fill.
+
+    Conflicts between sessions are found on exact minutes through an
+    :class:`~ttg.sessions.IntervalIndex` per faculty and per room, and a
+    fixed session whose period cells already hold its faculty or room is a
+    conflict too; a session that clashes is not pinned and is reported in
+    ``timetable.conflicts`` (a clashing fixed session's hours are then left
+    to the greedy fill).
+    """
+    remaining = {k: {s: dict(h) for s, h in hours.items()} for k, hours in class_subject_hours.items()}
+    intervals = timetable.calendar.intervals
+    index = IntervalIndex()
+    day_index = {day: d for d, day in enumerate(timetable.days)}
+
+    def record(class_key, name, d, start, end, teacher, room, kind):
+        label = f"{class_key} {name} {format_minutes(start)}-{format_minutes(end)}"
+        for resource in ([teacher] if teacher != UNASSIGNED_TEACHER else []) + [room]:
+            index.add(resource, d, start, end, label)
+        timetable.sessions.append({
+            "class": class_key, "name": name, "day": timetable.days[d], "start": format_minutes(start),
+            "end": format_minutes(end), "teacher": teacher, "room": room, "kind": kind,
+        })
+
+    def clash(teacher, room, d, start, end):
+        for resource in ([teacher] if teacher != UNASSIGNED_TEACHER else []) + [room]:
+            other = index.overlap(resource, d, start, end)
+            if other:
+                return f"{resource} is already in {other}"
+        return None
+
+    for class_key, sessions in (fixed_sessions or {}).items():
+        c = timetable.class_index(class_key)
+        room = class_rooms[class_key]
+        for session in sessions:
+            subject, teacher = session["subject"], session.get("faculty") or UNASSIGNED_TEACHER
+            start = to_minutes(session["start_time"])
+            end = start + int(session["duration"])
+            where = f"{class_key} {subject} on {session['day']} {format_minutes(start)}-{format_minutes(end)}"
+            d = day_index.get(session["day"])
+            if d is None:
+                timetable.conflicts.append(f"{where}: not a working day")
+                continue
+            reason = clash(teacher, room, d, start, end)
+            if reason:
+                timetable.conflicts.append(f"{where}: {reason}")
+                continue
+            cells = [p for p in session_periods(intervals, timetable.open_mask(d, c), start, end)
+                     if timetable.subject[d, p, c] < 0]
+            if not cells:
+                timetable.conflicts.append(f"{where}: no free teaching period at that time")
+                continue
+            bits = sum(1 << p for p in cells)
+            # Sessions apart in minutes can still share a period cell of the grid
+            taken = [resource for resource in ([teacher] if teacher != UNASSIGNED_TEACHER else []) + [room]
+                     if not occupancy.is_free(resource, d, bits)]
+            if taken:
+                labels = ", ".join(timetable.periods[p] for p in cells)
+                timetable.conflicts.append(f"{where}: {taken[0]} is already booked in period {labels}")
+                continue
+            _book(teacher, d, bits, len(cells), occupancy, teacher_load)
+            occupancy.book(_class_slot(class_key), d, bits)
+            for p in cells:
+                _book_room(room, d, p, 1, occupancy, pool)
+            for p in cells:
+                timetable.place(d, p, c, subject, teacher, room, KIND_FIXED)
+            record(class_key, subject, d, start, end, teacher, room, "fixed")
+            hours = remaining.get(class_key, {}).get(subject)
+            if hours is not None:
+                # Pinned periods count as theory first, then practical
+                from_th = min(hours['TH'], len(cells))
+                hours['TH'] -= from_th
+                hours['PR'] = max(0, hours['PR'] - (len(cells) - from_th))
+
+    for class_key, sessions in (flexible_sessions or {}).items():
+        c = timetable.class_index(class_key)
+        room = class_rooms[class_key]
+        for session in sessions:
+            name, width = session["name"], int(session["duration"])
+            wanted = session.get("day", "Any")
+            days = [day_index[wanted]] if wanted in day_index else range(len(timetable.days))
+            busy = _class_slot(class_key)
+            # Least busy day first, so "Any" sessions spread out
+            days = sorted(days, key=lambda d: bin(occupancy.mask(busy, d)).count("1"))
+            placed = False
+            for d in days:
+                period = free_block(occupancy.mask(busy, d) | occupancy.mask(room, d), timetable.open_mask(d, c), width)
+                if period is None:
+                    continue
+                start, end = intervals[period][0], intervals[period + width - 1][1]
+                if clash(UNASSIGNED_TEACHER, room, d, start, end):
+                    continue
+                occupancy.book(busy, d, ((1 << width) - 1) << period)
+                _book_room(room, d, period, width, occupancy, pool)
+                for p in range(period, period + width):
+                    timetable.place(d, p, c, name, UNASSIGNED_TEACHER, room, KIND_SESSION)
+                record(class_key, name, d, start, end, UNASSIGNED_TEACHER, room, "flexible")
+                placed = True
+                break
+            if not placed:
+                timetable.unplaced.setdefault(class_key, {})[name] = width
+    return remaining
+
+
+# --- Whole-institution solve ---
+def _solve_counts(timetable):
+    return {
+        "classes": len(timetable.classes),
+        "placed": int((timetable.subject != EMPTY).sum()),
+        "unplaced": sum(sum(missing.values()) for missing in timetable.unplaced.values()),
+        "sessions": len(timetable.sessions),
+    }
+
+
+@timed("solve", _solve_counts)
+def generate_institution_timetables(subject_teacher_map, class_subject_hours, days, periods, breaks,
+                                    class_rooms, rng=None, fixed_sessions=None, flexible_sessions=None,
+                                    rooms=None, class_sizes=None, calendar=None, class_shifts=None):
+    """Solve every class together so no teacher or room is double-booked.
+
+    ``class_subject_hours`` maps a class key (e.g. ``"10 A"``) to its
+    ``subject_hours`` dict and ``class_rooms`` maps the same key to its room.
+    Teacher and room bookings live in one shared :class:`Occupancy`, so each
+    conflict check is O(1) and the solve is linear in the number of classes.
+
+    ``rooms`` is an optional list of :data:`~ttg.rooms.Room` (see
+    :mod:`ttg.rooms`). Practical pairs then get the smallest free lab that
+    seats the class (``class_sizes`` maps a class key to its strength), and
+    theory periods fall back to a free lecture room whenever the class's own
+    room is taken or empty.
+
+    ``calendar`` is a compiled :class:`~ttg.calendar.Calendar` (per-day grids,
+    shifts); when given it replaces ``days``/``periods``/``breaks``, and
+    ``class_shifts`` maps a class key to its shift. The solver only walks the
+    periods the calendar marks as teaching for the class's shift on each day.
+
+    ``fixed_sessions`` and ``flexible_sessions`` map a class key to coaching
+    sessions (see :func:`_pin_sessions`); they are placed before the greedy
+    fill, which then only covers the hours they leave.
+
+    Returns a :class:`~ttg.grid.Timetable`; periods that could not be placed
+    are listed in its ``unplaced`` dict.
+    """
+    rng = rng or random
+    calendar = calendar or calendar_for(days, periods, breaks)
+    timetable = Timetable(calendar.days, calendar.periods, calendar.breaks, list(class_subject_hours),
+                          calendar=calendar, class_shifts=class_shifts)
+    unknown = sorted(set(timetable.class_shifts.values()) - set(calendar.shifts))
+    if unknown:
+        raise ValueError(f"Shifts not in the calendar: {', '.join(unknown)}")
+    occupancy = Occupancy(len(calendar.days))
+    teacher_load = {}
+    pool = RoomPool(rooms, len(calendar.days), len(calendar.periods)) if rooms else None
+    class_sizes = class_sizes or {}
+    if fixed_sessions or flexible_sessions:
+        class_subject_hours = _pin_sessions(timetable, class_subject_hours, class_rooms, fixed_sessions,
+                                            flexible_sessions, occupancy, teacher_load, pool)
+
+    for class_key, subject_hours in class_subject_hours.items():
+        unplaced = _solve_class(
+            timetable, class_key, subject_teacher_map, subject_hours, class_rooms[class_key],
+            occupancy, teacher_load, rng, pool, class_sizes.get(class_key, 0)
+        )
+        if unplaced:
+            timetable.unplaced.setdefault(class_key, {}).update(unplaced)
+    return timetable
+
+
+# --- Function to generate timetable ---
+def generate_timetable(subject_teacher_map, subject_hours, days, periods, breaks, class_room, rng=None,
+                       class_key="Class"):
+    """Single-class solve; returns the rendered ``(timetable_df, teacher_timetable)`` pair.
+
+    ``rng`` is any object with ``choice`` and ``random`` methods (e.g.
+    ``random.Random(seed)``); it defaults to the global ``random`` module.
+    """
+    timetable = generate_institution_timetables(
+        subject_teacher_map, {class_key: subject_hours}, days, periods, breaks, {class_key: class_room}, rng=rng
+    )
+    return timetable.class_frame(class_key), timetable.teacher_schedules()
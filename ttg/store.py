@@ -0,0 +1,212 @@
+"""SQLite store of generated timetables, queryable without re-solving.
+
+Each saved version is one ``versions`` row (input fingerprint, seed,
+metrics, grid) plus one ``lessons`` row per filled cell, indexed by teacher,
+by class and by slot. A version is written in a single transaction and read
+back into a :class:`~ttg.grid.Timetable` with one indexed scan.
+"""
+import contextlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .grid import EMPTY, Timetable
+from .instrument import timed
+from .solver import UNASSIGNED_TEACHER
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    seed INTEGER,
+    label TEXT,
+    created REAL NOT NULL,
+    metrics TEXT,
+    days TEXT NOT NULL,
+    periods TEXT NOT NULL,
+    breaks TEXT NOT NULL,
+    n_classes INTEGER NOT NULL,
+    extra BLOB
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    version_id INTEGER NOT NULL REFERENCES versions(id) ON DELETE CASCADE,
+    class_key TEXT NOT NULL,
+    class TEXT NOT NULL,
+    section TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    teacher TEXT NOT NULL,
+    room TEXT NOT NULL,
+    kind INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lessons_by_teacher ON lessons (teacher, version_id);
+CREATE INDEX IF NOT EXISTS lessons_by_class ON lessons (class_key, version_id);
+CREATE INDEX IF NOT EXISTS lessons_by_slot ON lessons (version_id, day, period);
+"""
+
+
+def store_path():
+    """Database file (``$TTG_STORE`` or ``~/.local/share/ttg/timetables.sqlite3``)."""
+    return os.environ.get("TTG_STORE") or os.path.join(
+        os.path.expanduser("~"), ".local", "share", "ttg", "timetables.sqlite3")
+
+
+def split_class_key(class_key):
+    """``"10 A"`` -> ``("10", "A")``; a key without a space has an empty section."""
+    name, _, section = class_key.rpartition(" ")
+    return (name, section) if name else (class_key, "")
+
+
+class TimetableStore:
+    """Saved timetable versions in one SQLite file; safe to share across threads."""
+
+    def __init__(self, path=None):
+        self.path = path or store_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # An in-memory database only lives as long as its one connection
+        self._memory = sqlite3.connect(self.path, check_same_thread=False) if self.path == ":memory:" else None
+        self._memory_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection inside one transaction; file connections are per call so threads never share one."""
+        if self._memory is not None:
+            with self._memory_lock, self._memory:
+                yield self._memory
+            return
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @timed("store save")
+    def save(self, timetable, fingerprint, seed=None, label=None, metrics=None, extra=None):
+        """Store ``timetable`` under ``fingerprint`` and return its version id.
+
+        Saving a fingerprint that is already stored returns the existing id.
+        ``extra`` is any picklable payload kept with the version (e.g. the
+        solve jobs, to regenerate or repair it later).
+        """
+        tt = timetable
+        d, p, c = np.nonzero(tt.subject != EMPTY)
+        names = [split_class_key(key) for key in tt.classes.names]
+        subjects, teachers, rooms = (interner.lookup_array() for interner in (tt.subjects, tt.teachers, tt.rooms))
+        payload = {"calendar": tt.calendar, "class_shifts": tt.class_shifts, "unplaced": tt.unplaced,
+                   "sessions": tt.sessions, "conflicts": tt.conflicts, "classes": tt.classes.names, "extra": extra}
+        with self._connect() as conn:
+            row = conn.execute("SELECT id FROM versions WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row:
+                return row[0]
+            cursor = conn.execute(
+                "INSERT INTO versions (fingerprint, seed, label, created, metrics, days, periods, breaks, n_classes,"
+                " extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, seed, label, time.time(), json.dumps(metrics) if metrics else None,
+                 json.dumps(tt.days), json.dumps(tt.periods), json.dumps(tt.breaks), len(tt.classes),
+                 pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)),
+            )
+            version_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO lessons VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([version_id] * len(d), (tt.classes[i] for i in c.tolist()),
+                    (names[i][0] for i in c.tolist()), (names[i][1] for i in c.tolist()),
+                    d.tolist(), p.tolist(),
+                    subjects[tt.subject[d, p, c]].tolist(), teachers[tt.teacher[d, p, c]].tolist(),
+                    rooms[tt.room[d, p, c]].tolist(), tt.kind[d, p, c].tolist()),
+            )
+        return version_id
+
+    def versions(self, limit=50):
+        """Newest first: ``[{id, fingerprint, seed, label, created, metrics, n_classes}]``."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, fingerprint, seed, label, created, metrics, n_classes FROM versions"
+                " ORDER BY created DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        return [{"id": r[0], "fingerprint": r[1], "seed": r[2], "label": r[3], "created": r[4],
+                 "metrics": json.loads(r[5]) if r[5] else None, "n_classes": r[6]} for r in rows]
+
+    def find(self, fingerprint):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id FROM versions WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return row[0] if row else None
+
+    @timed("store load")
+    def load(self, version_id):
+        """``(timetable, extra)`` for a saved version; raises ``KeyError`` if there is none."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT days, periods, breaks, extra FROM versions WHERE id = ?",
+                               (version_id,)).fetchone()
+            if row is None:
+                raise KeyError(version_id)
+            lessons = conn.execute(
+                "SELECT class_key, day, period, subject, teacher, room, kind FROM lessons WHERE version_id = ?",
+                (version_id,)).fetchall()
+        payload = pickle.loads(row[3])
+        tt = Timetable(json.loads(row[0]), json.loads(row[1]), json.loads(row[2]), payload["classes"],
+                       calendar=payload["calendar"], class_shifts=payload["class_shifts"])
+        tt.unplaced, tt.sessions, tt.conflicts = payload["unplaced"], payload["sessions"], payload["conflicts"]
+        if lessons:
+            class_key, day, period, subject, teacher, room, kind = zip(*lessons)
+            c = np.array([tt.classes.ids[k] for k in class_key])
+            d, p = np.array(day), np.array(period)
+            for array, interner, values in ((tt.subject, tt.subjects, subject), (tt.teacher, tt.teachers, teacher),
+                                            (tt.room, tt.rooms, room)):
+                array[d, p, c] = [interner.intern(v) for v in values]
+            tt.kind[d, p, c] = kind
+        return tt, payload["extra"]
+
+    def delete(self, version_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM lessons WHERE version_id = ?", (version_id,))
+            conn.execute("DELETE FROM versions WHERE id = ?", (version_id,))
+
+    # --- Queries straight from the lesson rows ---
+    def teacher_load(self, version_id, teachers=None):
+        """``{teacher: periods per week}`` across every class of a version; the TBD placeholder is no teacher."""
+        sql = "SELECT teacher, COUNT(*) FROM lessons WHERE version_id = ? AND teacher != ?"
+        args = [version_id, UNASSIGNED_TEACHER]
+        if teachers:
+            sql += f" AND teacher IN ({', '.join('?' * len(teachers))})"
+            args += list(teachers)
+        with self._connect() as conn:
+            return dict(conn.execute(sql + " GROUP BY teacher ORDER BY teacher", args).fetchall())
+
+    def teacher_lessons(self, teacher, version_id=None):
+        """``[{version_id, class_key, day, period, subject, room}]`` for one teacher, via its index."""
+        sql = "SELECT version_id, class_key, day, period, subject, room FROM lessons WHERE teacher = ?"
+        args = [teacher]
+        if version_id is not None:
+            sql += " AND version_id = ?"
+            args.append(version_id)
+        keys = ("version_id", "class_key", "day", "period", "subject", "room")
+        with self._connect() as conn:
+            return [dict(zip(keys, r)) for r in conn.execute(sql + " ORDER BY version_id, day, period", args)]
+
+    def class_lessons(self, class_key, version_id):
+        keys = ("day", "period", "subject", "teacher", "room", "kind")
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day, period, subject, teacher, room, kind FROM lessons WHERE class_key = ? AND version_id = ?"
+                " ORDER BY day, period", (class_key, version_id))
+            return [dict(zip(keys, r)) for r in rows]
+
+    def slot(self, version_id, day, period):
+        """Who teaches what in one ``(day, period)`` slot of a version."""
+        keys = ("class_key", "subject", "teacher", "room")
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT class_key, subject, teacher, room FROM lessons WHERE version_id = ? AND day = ? AND period = ?",
+                (version_id, day, period))
+            return [dict(zip(keys, r)) for r in rows]
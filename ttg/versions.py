@@ -0,0 +1,117 @@
+"""Best-of-N generation: solve many seeded candidates in parallel and keep the top k.
+
+Workers only send back ``(seed, metrics)``; the kept candidates are re-solved
+from their seeds in the parent, which is cheap and proves the seed reproduces
+the exact timetable.
+"""
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from .instrument import phase
+from .optimize import optimize
+from .quality import evaluate
+from .solver import generate_institution_timetables
+
+# Job passed to pool workers once, via the initializer
+_worker_job = None
+
+
+def make_job(subject_teacher_map, class_subject_hours, days, periods, breaks, class_rooms, weights=None,
+             optimize_moves=0, fixed_sessions=None, flexible_sessions=None, rooms=None, class_sizes=None,
+             calendar=None, class_shifts=None):
+    """Bundle solve inputs into a picklable dict shared by every candidate.
+
+    ``optimize_moves`` > 0 runs that many annealing moves on each greedy
+    solution; a move budget (not a time budget) keeps seeds reproducible.
+    ``fixed_sessions``/``flexible_sessions`` are coaching sessions per class
+    key, pinned before the greedy fill. ``rooms`` (a list of
+    :data:`~ttg.rooms.Room`) and ``class_sizes`` enable per-slot room allocation.
+    ``calendar`` (a compiled :class:`~ttg.calendar.Calendar`) and
+    ``class_shifts`` give per-day grids and shifts.
+    """
+    return {
+        "subject_teacher_map": subject_teacher_map,
+        "class_subject_hours": class_subject_hours,
+        "days": list(days),
+        "periods": list(periods),
+        "breaks": dict(breaks),
+        "class_rooms": class_rooms,
+        "weights": weights,
+        "optimize_moves": optimize_moves,
+        "fixed_sessions": fixed_sessions,
+        "flexible_sessions": flexible_sessions,
+        "rooms": list(rooms) if rooms else None,
+        "class_sizes": class_sizes,
+        "calendar": calendar,
+        "class_shifts": class_shifts,
+    }
+
+
+def regenerate(job, seed):
+    """Rebuild the exact timetable a candidate with ``seed`` produced."""
+    rng = random.Random(seed)
+    timetable = generate_institution_timetables(
+        job["subject_teacher_map"], job["class_subject_hours"], job["days"], job["periods"], job["breaks"],
+        job["class_rooms"], rng=rng, fixed_sessions=job.get("fixed_sessions"),
+        flexible_sessions=job.get("flexible_sessions"), rooms=job.get("rooms"), class_sizes=job.get("class_sizes"),
+        calendar=job.get("calendar"), class_shifts=job.get("class_shifts")
+    )
+    if job.get("optimize_moves"):
+        optimize(timetable, job["weights"], time_limit=None, max_moves=job["optimize_moves"], rng=rng)
+    return timetable
+
+
+def _score_seed(job, seed):
+    return seed, evaluate(regenerate(job, seed), job["weights"])
+
+
+def _init_worker(job):
+    global _worker_job
+    _worker_job = job
+
+
+def _score_seed_in_worker(seed):
+    return _score_seed(_worker_job, seed)
+
+
+def draw_seeds(n, base_seed=None):
+    """``n`` distinct 32-bit seeds; the same ``base_seed`` always yields the same list."""
+    if base_seed is None:
+        base_seed = random.SystemRandom().randrange(2 ** 32)
+    rng = random.Random(base_seed)
+    seeds = []
+    seen = set()
+    while len(seeds) < n:
+        seed = rng.randrange(2 ** 32)
+        if seed not in seen:
+            seen.add(seed)
+            seeds.append(seed)
+    return seeds
+
+
+def generate_candidates(job, n, top_k=1, base_seed=None, seeds=None, workers=None):
+    """Solve ``n`` candidates and return the best ``top_k``, lowest score first.
+
+    Each result is a dict with ``seed``, ``metrics`` and ``timetable``.
+    ``workers=1`` (or a single candidate) runs in-process; otherwise the
+    candidates are spread over a process pool of ``workers`` processes
+    (default: CPU count).
+    """
+    seeds = list(seeds) if seeds is not None else draw_seeds(n, base_seed)
+    workers = workers or os.cpu_count() or 1
+    with phase("candidates") as call:
+        if workers == 1 or len(seeds) == 1:
+            scored = [_score_seed(job, seed) for seed in seeds]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as pool:
+                chunksize = max(1, len(seeds) // (workers * 4))
+                scored = list(pool.map(_score_seed_in_worker, seeds, chunksize=chunksize))
+        call.count(candidates=len(seeds), workers=1 if workers == 1 or len(seeds) == 1 else workers)
+
+    # Ties keep draw order so the ranking is deterministic
+    ranked = sorted(enumerate(scored), key=lambda item: (item[1][1]["score"], item[0]))
+    best = []
+    for _, (seed, metrics) in ranked[:top_k]:
+        best.append({"seed": seed, "metrics": metrics, "timetable": regenerate(job, seed)})
+    return best